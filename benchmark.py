@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Reproducible latency/throughput benchmark for the Multi-Intent NLP Model
+
+Sweeps batch size, sequence length, intra-op and inter-op thread counts and
+inference modes against a randomly initialized MultiIntentClassifier (no
+checkpoint or download needed), and reports p50/p95/p99 latency,
+sentences per second and peak RSS as JSON. Every (mode, inter-op threads)
+combination runs in a fresh process, because PyTorch only allows the
+inter-op pool to be sized once per process. peak_rss_mb is the peak RSS
+of the warmup and timed runs of each row: on Linux the high-water mark is
+reset (/proc/self/clear_refs) after the model is built, elsewhere it falls
+back to ru_maxrss, the peak of the whole process.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --compare bench.json --tolerance 0.1
+"""
+import os
+import gc
+import sys
+import json
+import time
+import queue
+import platform
+import argparse
+import multiprocessing
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MODES = ("eager", "traced", "quantized")
+
+
+def _reset_peak_rss():
+    """Restart the peak RSS measurement at the current RSS (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb():
+    """Peak RSS since _reset_peak_rss, or of the whole process where it cannot be reset"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def build_random_model(num_intents=10, num_layers=12, seed=0):
+    """bert-base sized MultiIntentClassifier with random weights"""
+    import torch
+    from transformers import BertConfig
+    from model_architecture import MultiIntentClassifier
+
+    torch.manual_seed(seed)
+    model = MultiIntentClassifier(num_intents=num_intents, config=BertConfig(num_hidden_layers=num_layers))
+    model.eval()
+    return model
+
+
+def _build_engine(mode, model):
+    from inference_engines import EagerEngine, TracedEngine
+    from quantization import quantize_model
+
+    if mode == "eager":
+        return EagerEngine(model)
+    if mode == "traced":
+        return TracedEngine(model)
+    if mode == "quantized":
+        return EagerEngine(quantize_model(model, inplace=True))
+    raise ValueError(f"Unknown mode '{mode}', expected one of: {', '.join(MODES)}")
+
+
+def _run_config(config, result_queue):
+    """Benchmark one (mode, inter-op threads) combination in its own process"""
+    try:
+        import torch
+        torch.set_num_interop_threads(config["inter_op_threads"])
+
+        model = build_random_model(num_layers=config["num_layers"], seed=config["seed"])
+        engine = _build_engine(config["mode"], model)
+        vocab_size = model.bert.config.vocab_size
+        generator = torch.Generator().manual_seed(config["seed"])
+
+        results = []
+        for intra_op_threads in config["intra_op_threads"]:
+            torch.set_num_threads(intra_op_threads)
+            for seq_len in config["seq_lens"]:
+                for batch_size in config["batch_sizes"]:
+                    input_ids = torch.randint(1, vocab_size, (batch_size, seq_len), generator=generator)
+                    attention_mask = torch.ones_like(input_ids)
+
+                    # Measure this row, not building the fp32 model or earlier rows
+                    gc.collect()
+                    _reset_peak_rss()
+                    for _ in range(config["warmup"]):
+                        engine(input_ids, attention_mask)
+
+                    latencies = []
+                    for _ in range(config["iterations"]):
+                        start = time.perf_counter()
+                        engine(input_ids, attention_mask)
+                        latencies.append((time.perf_counter() - start) * 1000)
+
+                    latencies = np.array(latencies)
+                    results.append({
+                        "mode": config["mode"],
+                        "batch_size": batch_size,
+                        "seq_len": seq_len,
+                        "intra_op_threads": intra_op_threads,
+                        "inter_op_threads": config["inter_op_threads"],
+                        "iterations": config["iterations"],
+                        "p50_ms": float(np.percentile(latencies, 50)),
+                        "p95_ms": float(np.percentile(latencies, 95)),
+                        "p99_ms": float(np.percentile(latencies, 99)),
+                        "mean_ms": float(latencies.mean()),
+                        "sentences_per_sec": float(batch_size * 1000 / latencies.mean()),
+                        "peak_rss_mb": _peak_rss_mb()
+                    })
+        result_queue.put(("ok", results))
+    except Exception as e:
+        result_queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def _wait_for_result(process, result_queue, timeout):
+    """(status, payload) of a _run_config process, or an error if it dies or runs past timeout"""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            return result_queue.get(timeout=1.0)
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            # The result may have been sent just before the process exited
+            try:
+                return result_queue.get(timeout=1.0)
+            except queue.Empty:
+                return "error", f"Process exited with code {process.exitcode} without a result"
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            return "error", f"Timed out after {timeout:.0f}s"
+
+
+def run_benchmark(modes=MODES, batch_sizes=(1, 8, 32), seq_lens=(16, 64, 128),
+                  intra_op_threads=(1, 4), inter_op_threads=(1,), iterations=30, warmup=3,
+                  num_layers=12, seed=0, timeout=3600):
+    """Run the full sweep and return the JSON-serializable report
+
+    A combination whose process crashes, exits with an error code or takes
+    longer than timeout seconds is listed under "errors".
+    """
+    import torch
+
+    context = multiprocessing.get_context("spawn")
+    results = []
+    errors = []
+    for mode in modes:
+        for inter in inter_op_threads:
+            config = {
+                "mode": mode,
+                "inter_op_threads": inter,
+                "intra_op_threads": list(intra_op_threads),
+                "batch_sizes": list(batch_sizes),
+                "seq_lens": list(seq_lens),
+                "iterations": iterations,
+                "warmup": warmup,
+                "num_layers": num_layers,
+                "seed": seed
+            }
+            print(f"⏱️ Benchmarking mode={mode}, inter-op threads={inter}...", flush=True)
+            result_queue = context.Queue()
+            process = context.Process(target=_run_config, args=(config, result_queue))
+            process.start()
+            status, payload = _wait_for_result(process, result_queue, timeout)
+            process.join()
+            if status == "ok" and process.exitcode != 0:
+                status, payload = "error", f"Process exited with code {process.exitcode}"
+            if status == "ok":
+                results.extend(payload)
+            else:
+                print(f"   ❌ {payload}")
+                errors.append({"mode": mode, "inter_op_threads": inter, "error": payload})
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "torch_version": torch.__version__,
+            "python_version": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "num_layers": num_layers,
+            "seed": seed
+        },
+        "results": results,
+        "errors": errors
+    }
+
+
+def _result_key(result):
+    return (result["mode"], result["batch_size"], result["seq_len"],
+            result["intra_op_threads"], result["inter_op_threads"])
+
+
+def compare_reports(baseline, current, tolerance=0.10):
+    """Flag configurations whose p95 latency rose or throughput fell by more than tolerance"""
+    baseline_results = {_result_key(r): r for r in baseline["results"]}
+    comparisons = []
+    for result in current["results"]:
+        reference = baseline_results.get(_result_key(result))
+        if reference is None:
+            continue
+        p95_change = result["p95_ms"] / reference["p95_ms"] - 1
+        throughput_change = result["sentences_per_sec"] / reference["sentences_per_sec"] - 1
+        comparisons.append({
+            "key": _result_key(result),
+            "p95_change": p95_change,
+            "throughput_change": throughput_change,
+            "regression": p95_change > tolerance or throughput_change < -tolerance
+        })
+    return comparisons
+
+
+def print_report(report):
+    print(f"\n{'mode':>9} {'batch':>5} {'seq':>4} {'intra':>5} {'inter':>5} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'sent/s':>9} {'RSS MB':>8}")
+    for r in report["results"]:
+        rss = f"{r['peak_rss_mb']:.0f}" if r["peak_rss_mb"] is not None else "-"
+        print(f"{r['mode']:>9} {r['batch_size']:>5} {r['seq_len']:>4} {r['intra_op_threads']:>5} "
+              f"{r['inter_op_threads']:>5} {r['p50_ms']:>9.2f} {r['p95_ms']:>9.2f} "
+              f"{r['p99_ms']:>9.2f} {r['sentences_per_sec']:>9.1f} {rss:>8}")
+
+
+def print_comparison(comparisons, tolerance):
+    regressions = [c for c in comparisons if c["regression"]]
+    print(f"\n📊 Compared {len(comparisons)} configurations against the baseline "
+          f"(tolerance {tolerance:.0%})")
+    for c in comparisons:
+        marker = "❌" if c["regression"] else "✅"
+        mode, batch, seq, intra, inter = c["key"]
+        print(f"   {marker} {mode} batch={batch} seq={seq} intra={intra} inter={inter}: "
+              f"p95 {c['p95_change']:+.1%}, throughput {c['throughput_change']:+.1%}")
+    if regressions:
+        print(f"⚠️ {len(regressions)} regressions")
+    else:
+        print("🎉 No regressions")
+    return regressions
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency/throughput benchmark sweep")
+    parser.add_argument("--modes", default=",".join(MODES), help=f"Comma list of: {', '.join(MODES)}")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[1, 8, 32])
+    parser.add_argument("--seq-lens", type=_int_list, default=[16, 64, 128])
+    parser.add_argument("--intra-threads", type=_int_list, default=[1, 4])
+    parser.add_argument("--inter-threads", type=_int_list, default=[1])
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--num-layers", type=int, default=12, help="Encoder layers of the random model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=3600,
+                        help="Seconds allowed per (mode, inter-op threads) process")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", metavar="BASELINE", help="Baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative slowdown")
+    args = parser.parse_args()
+
+    report = run_benchmark(
+        modes=[m for m in args.modes.split(",") if m],
+        batch_sizes=args.batch_sizes,
+        seq_lens=args.seq_lens,
+        intra_op_threads=args.intra_threads,
+        inter_op_threads=args.inter_threads,
+        iterations=args.iterations,
+        warmup=args.warmup,
+        num_layers=args.num_layers,
+        seed=args.seed,
+        timeout=args.timeout
+    )
+    print_report(report)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n💾 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if print_comparison(compare_reports(baseline, report, args.tolerance), args.tolerance):
+            sys.exit(1)
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Multi-process bulk scoring for the Multi-Intent NLP Model
+
+The model is loaded once in the parent process. Workers are forked from it
+so the weights are shared copy-on-write (or through the page cache when the
+predictor uses memory-mapped weights); where fork is unavailable the
+weights are moved to shared memory and handed to spawned workers. Each
+worker gets its own intra-op thread budget, texts are split into shards,
+and results are merged back in input order.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import itertools
+import argparse
+
+import torch
+import torch.multiprocessing as mp
+
+_worker_predictor = None
+
+
+def available_cores():
+    """Cores this process may run on (respects CPU affinity where supported)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def default_parallelism(num_workers=None, threads_per_worker=None):
+    """Split the available cores into (num_workers, threads_per_worker)"""
+    cores = available_cores()
+    if num_workers is None:
+        threads_per_worker = threads_per_worker or min(4, cores)
+        num_workers = max(1, cores // threads_per_worker)
+    elif threads_per_worker is None:
+        threads_per_worker = max(1, cores // num_workers)
+    return num_workers, threads_per_worker
+
+
+def _init_worker(predictor, threads_per_worker):
+    global _worker_predictor
+    torch.set_num_threads(threads_per_worker)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already fixed for this process
+    _worker_predictor = predictor
+
+
+def _score_shard(shard):
+    shard_id, texts, threshold, batch_size = shard
+    return shard_id, _worker_predictor.analyze_many(texts, threshold=threshold, batch_size=batch_size)
+
+
+def _iter_shards(texts, shard_size, threshold, batch_size):
+    iterator = iter(texts)
+    for shard_id in itertools.count():
+        shard = list(itertools.islice(iterator, shard_size))
+        if not shard:
+            return
+        yield shard_id, shard, threshold, batch_size
+
+
+def _worker_copy(predictor):
+    """Predictor to hand to workers: eager engine (traced graphs would copy the weights) and no caches
+
+    The semantic cache is dropped too: its approximate answers would depend
+    on which shards a worker happened to score before.
+    """
+    predictor.load_model()
+    worker = copy.copy(predictor)
+    worker.engine = None
+    worker.engine_name = "eager"
+    worker.cache = None
+    worker.semantic_cache = None
+    return worker
+
+
+def iter_bulk_scores(texts, predictor, num_workers=None, threads_per_worker=None, shard_size=1024,
+                     batch_size=32, threshold=0.5, ordered=True, max_in_flight=None):
+    """Score an iterable of texts across worker processes
+
+    With ordered=True yields PredictionResult objects in input order. With
+    ordered=False shards are yielded as they finish, as (index, result)
+    pairs keyed by the position of each text in the input. At most
+    max_in_flight shards (default 2 per worker) are queued at a time.
+    """
+    num_workers, threads_per_worker = default_parallelism(num_workers, threads_per_worker)
+    worker_predictor = _worker_copy(predictor)
+
+    if "fork" in mp.get_all_start_methods():
+        context = mp.get_context("fork")
+    else:
+        worker_predictor.model.share_memory()
+        context = mp.get_context("spawn")
+
+    # Submit shards through a bounded window so memory stays flat no matter
+    # how large the input is; finished shards arrive on a queue
+    max_in_flight = max_in_flight or 2 * num_workers
+    finished = queue.Queue()
+    next_shard = 0
+    buffered = {}
+    in_flight = 0
+
+    with context.Pool(num_workers, initializer=_init_worker,
+                      initargs=(worker_predictor, threads_per_worker)) as pool:
+
+        def take_finished():
+            nonlocal next_shard, in_flight
+            shard_id, results = finished.get()
+            in_flight -= 1
+            if isinstance(results, BaseException):
+                raise results
+            if not ordered:
+                start = shard_id * shard_size
+                return [(start + offset, result) for offset, result in enumerate(results)]
+
+            buffered[shard_id] = results
+            ready = []
+            while next_shard in buffered:
+                ready.extend(buffered.pop(next_shard))
+                next_shard += 1
+            return ready
+
+        for shard in _iter_shards(texts, shard_size, threshold, batch_size):
+            pool.apply_async(
+                _score_shard, (shard,),
+                callback=finished.put,
+                error_callback=lambda error, shard_id=shard[0]: finished.put((shard_id, error))
+            )
+            in_flight += 1
+            while in_flight >= max_in_flight:
+                yield from take_finished()
+
+        while in_flight:
+            yield from take_finished()
+
+
+def bulk_score(texts, predictor, **kwargs):
+    """Score texts across worker processes and return results in input order"""
+    return list(iter_bulk_scores(texts, predictor, ordered=True, **kwargs))
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Score a text file (one utterance per line) with N processes")
+    parser.add_argument("input", help="Input text file, one utterance per line")
+    parser.add_argument("output", help="Output JSONL file")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=1024)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--weights", help="Memory-mapped weights from mmap_weights.py")
+    args = parser.parse_args()
+
+    workers, threads = default_parallelism(args.workers, args.threads_per_worker)
+    print(f"🚀 Bulk scoring with {workers} workers × {threads} threads", file=sys.stderr)
+
+    predictor = MultiIntentPredictor(weights_path=args.weights)
+    start_time = time.time()
+    count = 0
+    with open(args.input) as source, open(args.output, "w") as sink:
+        texts = (line.rstrip("\n") for line in source)
+        for result in iter_bulk_scores(texts, predictor, num_workers=workers,
+                                       threads_per_worker=threads, shard_size=args.shard_size,
+                                       batch_size=args.batch_size, threshold=args.threshold):
+            sink.write(json.dumps(result.to_dict()) + "\n")
+            count += 1
+
+    elapsed = time.time() - start_time
+    print(f"✅ Scored {count} utterances in {elapsed:.1f}s ({count / max(elapsed, 1e-9):.1f}/s)",
+          file=sys.stderr)
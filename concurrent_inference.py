@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Thread-pool execution of a shared MultiIntentPredictor
+
+PyTorch sizes its intra-op (OpenMP) pool per calling thread, so when many
+request threads each run the model with the default of one thread per
+core, they oversubscribe the CPU. ConcurrentPredictor runs requests on a
+fixed pool of `concurrency` threads, each limited to `intra_op_threads`,
+so that concurrency x intra_op_threads matches the cores (e.g. 4 x 4 on a
+16-core machine). One model and one engine are shared by all threads.
+
+    with ConcurrentPredictor(MultiIntentPredictor(), concurrency=4, intra_op_threads=4) as pool:
+        results = pool.predict_many(texts)          # split across the pool, input order kept
+        future = pool.submit("Cancel my booking")   # from a threaded web server handler
+        future.result().intents
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from bulk_scoring import default_parallelism
+
+
+class ConcurrentPredictor:
+    """Runs predictor calls on concurrency threads with intra_op_threads each
+
+    Unset values are derived from the available cores (see
+    bulk_scoring.default_parallelism).
+    """
+
+    def __init__(self, predictor, concurrency=None, intra_op_threads=None, warmup=True):
+        self.predictor = predictor
+        self.concurrency, self.intra_op_threads = default_parallelism(concurrency, intra_op_threads)
+        try:
+            # Each request runs its own graph; inter-op parallelism would only add threads
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Already fixed for this process
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix="multi-intent",
+            initializer=torch.set_num_threads,
+            initargs=(self.intra_op_threads,)
+        )
+        if warmup:
+            # Load once up front rather than in whichever request comes first
+            self._executor.submit(predictor.get_engine).result()
+
+    def policy(self):
+        return {'concurrency': self.concurrency, 'intra_op_threads': self.intra_op_threads}
+
+    def submit(self, text, threshold=0.5, **options):
+        """Future of the PredictionResult for one text"""
+        return self._executor.submit(
+            lambda: self.predictor.analyze_many([text], threshold=threshold, **options)[0]
+        )
+
+    def _chunks(self, texts, batch_size):
+        size = math.ceil(len(texts) / self.concurrency)
+        if size > batch_size:
+            size = math.ceil(size / batch_size) * batch_size
+        return [texts[start:start + size] for start in range(0, len(texts), max(size, 1))]
+
+    def _map(self, method, texts, batch_size, **options):
+        texts = list(texts)
+        futures = [
+            self._executor.submit(method, chunk, batch_size=batch_size, **options)
+            for chunk in self._chunks(texts, batch_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
+
+    def analyze_many(self, texts, threshold=0.5, batch_size=32, **options):
+        """PredictionResult objects for texts, scored in parallel chunks, in input order"""
+        return self._map(self.predictor.analyze_many, texts, batch_size, threshold=threshold, **options)
+
+    def predict_many(self, texts, threshold=0.5, batch_size=32, **options):
+        """Intent lists for texts, scored in parallel chunks, in input order"""
+        return self._map(self.predictor.predict_many, texts, batch_size, threshold=threshold, **options)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
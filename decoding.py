@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Vectorized decoding of intent probabilities for whole batches
+
+Thresholding, top-k selection and the fallback intent are computed with
+array operations over the full [N, num_intents] probability matrix. The
+result is a DecodedBatch in a compact CSR-style layout (label indices and
+scores of all texts back to back, plus row offsets); lists of dicts are
+only built when asked for.
+
+    decoded = decode_batch(probabilities, labels, thresholds={"other": 0.7}, top_k=3,
+                           fallback="other", min_confidence=0.3)
+    decoded.indices, decoded.scores, decoded.offsets   # NumPy arrays
+    decoded.to_lists()                                 # [[{'intent', 'confidence', 'label_index'}, ...], ...]
+"""
+import numpy as np
+import torch
+
+
+class DecodedBatch:
+    """Selected intents of a batch: row i owns indices[offsets[i]:offsets[i + 1]]"""
+
+    __slots__ = ("indices", "scores", "offsets", "labels")
+
+    def __init__(self, indices, scores, offsets, labels):
+        self.indices = indices
+        self.scores = scores
+        self.offsets = offsets
+        self.labels = labels
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def row(self, i):
+        """(label indices, scores) of text i"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.indices[start:end], self.scores[start:end]
+
+    def counts(self):
+        return np.diff(self.offsets)
+
+    def to_lists(self):
+        """One list of {'intent', 'confidence', 'label_index'} dicts per text"""
+        labels = self.labels
+        entries = [
+            {'intent': labels[index], 'confidence': score, 'label_index': index}
+            for index, score in zip(self.indices.tolist(), self.scores.tolist())
+        ]
+        offsets = self.offsets.tolist()
+        return [entries[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+
+
+def threshold_vector(thresholds, labels, default=0.5):
+    """Per-label threshold array from a float, a sequence or a {label: threshold} dict
+
+    Labels missing from a dict keep default.
+    """
+    if isinstance(thresholds, dict):
+        unknown = set(thresholds) - set(labels)
+        if unknown:
+            raise ValueError(f"Thresholds for unknown labels: {', '.join(sorted(unknown))}")
+        return np.array([thresholds.get(label, default) for label in labels], dtype=np.float32)
+    if isinstance(thresholds, torch.Tensor):
+        thresholds = thresholds.detach().cpu().numpy()
+    return np.broadcast_to(np.asarray(thresholds, dtype=np.float32), (len(labels),))
+
+
+def decode_batch(probabilities, labels, thresholds=0.5, top_k=None, fallback=None,
+                 min_confidence=None):
+    """Decode a [N, num_intents] probability matrix in one pass
+
+    thresholds: float, per-label sequence/tensor, or {label: threshold} dict.
+    top_k: keep at most k intents per text; entries are then ordered by
+        confidence instead of label order.
+    fallback: label reported alone for texts where no intent clears its
+        threshold, or whose top probability is below min_confidence.
+    """
+    if isinstance(probabilities, torch.Tensor):
+        probabilities = probabilities.detach().cpu().numpy()
+    probabilities = np.asarray(probabilities, dtype=np.float32)
+    selected = probabilities > threshold_vector(thresholds, labels)
+
+    if fallback is not None:
+        if fallback not in labels:
+            raise ValueError(f"Fallback intent '{fallback}' is not one of the labels")
+        fallback_rows = ~selected.any(axis=1)
+        if min_confidence is not None and probabilities.shape[1]:
+            fallback_rows |= probabilities.max(axis=1) < min_confidence
+        selected[fallback_rows] = False
+        selected[fallback_rows, labels.index(fallback)] = True
+
+    if top_k is not None:
+        k = min(top_k, probabilities.shape[1])
+        ranked = np.argsort(np.where(selected, -probabilities, np.inf), axis=1, kind="stable")[:, :k]
+        keep = np.take_along_axis(selected, ranked, axis=1)
+        indices = ranked[keep]
+        counts = keep.sum(axis=1)
+    else:
+        _, indices = np.nonzero(selected)
+        counts = selected.sum(axis=1)
+
+    scores = probabilities[np.repeat(np.arange(len(probabilities)), counts), indices]
+    offsets = np.zeros(len(probabilities) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return DecodedBatch(indices.astype(np.int32), scores, offsets, labels)
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Knowledge distillation of the Multi-Intent NLP Model into a small student
+
+The current model (teacher) scores unlabeled utterances once; its logits
+are the soft multi-label targets. A shallow and/or narrow BERT student with
+the same intent head is trained against them with temperature-scaled
+binary cross-entropy. Everything lives in one output directory:
+
+    corpus.*            pre-tokenized utterances (see pretokenized_corpus.py)
+    teacher_logits.npy  teacher logits, one row per utterance
+    checkpoint.pt       student, optimizer and progress, rewritten every
+                        checkpoint_every steps so training can resume
+    student.flat        final student weights and config (mmap_weights format)
+
+The student is used like the full model:
+
+    python distillation.py utterances.txt --output-dir distilled --num-layers 4 --hidden-size 256
+    predictor = MultiIntentPredictor(weights_path="distilled/student.flat")
+"""
+import os
+import json
+import random
+import argparse
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from model_architecture import MultiIntentClassifier
+from pretokenized_corpus import PretokenizedCorpus, build_corpus
+from mmap_weights import save_flat_weights
+from evaluation import compare_probabilities, print_comparison
+from inference_engines import inference_mode
+
+STUDENT_FILENAME = "student.flat"
+CHECKPOINT_FILENAME = "checkpoint.pt"
+TARGETS_FILENAME = "teacher_logits.npy"
+
+
+def student_config(teacher_config, num_layers=4, hidden_size=None, num_attention_heads=None,
+                   intermediate_size=None):
+    """Student encoder config derived from the teacher's
+
+    The vocabulary and position embeddings stay the same, so the student
+    uses the teacher's tokenizer. Width defaults to the teacher's; when
+    hidden_size is given, heads default to one per 64 dimensions and the
+    feed-forward size to four times the hidden size.
+    """
+    config = teacher_config.to_dict()
+    hidden_size = hidden_size or teacher_config.hidden_size
+    if hidden_size != teacher_config.hidden_size:
+        num_attention_heads = num_attention_heads or max(1, hidden_size // 64)
+        intermediate_size = intermediate_size or 4 * hidden_size
+    config.update({
+        "num_hidden_layers": num_layers,
+        "hidden_size": hidden_size,
+        "num_attention_heads": num_attention_heads or teacher_config.num_attention_heads,
+        "intermediate_size": intermediate_size or teacher_config.intermediate_size
+    })
+    if config["hidden_size"] % config["num_attention_heads"]:
+        raise ValueError(
+            f"hidden_size {config['hidden_size']} is not divisible by "
+            f"num_attention_heads {config['num_attention_heads']}"
+        )
+    return config
+
+
+def _copy_matching(target, source):
+    """Copy every tensor of source into target whose name and shape match"""
+    source_state = source.state_dict()
+    target_state = target.state_dict()
+    copied = {
+        name: tensor for name, tensor in source_state.items()
+        if name in target_state and target_state[name].shape == tensor.shape
+        and not tensor.is_meta and tensor.is_floating_point()
+    }
+    target.load_state_dict(copied, strict=False)
+    return len(copied)
+
+
+def build_student(teacher, config, seed=0):
+    """Student MultiIntentClassifier, warm-started from the teacher where shapes allow
+
+    With the teacher's width, embeddings, pooler and classifier are copied
+    and student layer i starts from evenly spaced teacher layers; a narrower
+    student starts from random weights.
+    """
+    torch.manual_seed(seed)
+    student = MultiIntentClassifier(num_intents=teacher.classifier.out_features, config=config)
+    if getattr(teacher, "is_quantized", False):
+        return student
+
+    _copy_matching(student.bert.embeddings, teacher.bert.embeddings)
+    _copy_matching(student.bert.pooler, teacher.bert.pooler)
+    _copy_matching(student.classifier, teacher.classifier)
+
+    teacher_layers = teacher.bert.encoder.layer
+    student_layers = student.bert.encoder.layer
+    stride = len(teacher_layers) / len(student_layers)
+    for i, layer in enumerate(student_layers):
+        _copy_matching(layer, teacher_layers[min(int((i + 1) * stride) - 1, len(teacher_layers) - 1)])
+    return student
+
+
+def generate_teacher_targets(teacher, corpus, path, batch_size=64):
+    """Teacher logits for every corpus sequence, written to a .npy file batch by batch"""
+    logits = np.lib.format.open_memmap(
+        path + ".part", mode="w+", dtype=np.float32, shape=(len(corpus), teacher.num_intents)
+    )
+    done = 0
+    for indices, probabilities in teacher.score_corpus(corpus, batch_size=batch_size):
+        logits[indices] = torch.logit(probabilities, eps=1e-6).numpy()
+        done += len(indices)
+        print(f"\r🎓 Teacher scored {done}/{len(corpus)} utterances", end="", flush=True)
+    print()
+    logits.flush()
+    del logits
+    os.replace(path + ".part", path)
+
+
+def _epoch_batches(indices, lengths, batch_size, epoch, seed, sort_window=50):
+    """Shuffled batches of similar length, reproducible from (seed, epoch)"""
+    rng = np.random.default_rng(seed + epoch)
+    indices = rng.permutation(indices)
+    window = batch_size * sort_window
+    batches = []
+    for start in range(0, len(indices), window):
+        chunk = indices[start:start + window]
+        chunk = chunk[np.argsort(lengths[chunk], kind="stable")]
+        batches.extend(chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size))
+    rng.shuffle(batches)
+    return batches
+
+
+def _save_checkpoint(path, student, optimizer, config, epoch, step, losses):
+    torch.save({
+        'state_dict': student.state_dict(),
+        'optimizer': optimizer.state_dict(),
+        'config': config,
+        'num_intents': student.classifier.out_features,
+        'epoch': epoch,
+        'step': step,
+        'losses': losses
+    }, path + ".part")
+    os.replace(path + ".part", path)
+
+
+def distillation_loss(student_logits, teacher_logits, temperature=2.0):
+    """Binary cross-entropy against temperature-softened teacher probabilities"""
+    targets = torch.sigmoid(teacher_logits / temperature)
+    loss = F.binary_cross_entropy_with_logits(student_logits / temperature, targets)
+    return loss * temperature ** 2
+
+
+def distill(teacher, texts, output_dir="distilled", num_layers=4, hidden_size=None,
+            num_attention_heads=None, intermediate_size=None, epochs=3, batch_size=32, lr=1e-4,
+            temperature=2.0, holdout=0.1, checkpoint_every=200, seed=0, threshold=0.5,
+            num_threads=None):
+    """Distill a MultiIntentPredictor teacher into a student saved as student.flat
+
+    texts is an iterable of unlabeled utterances; it is only read when the
+    output directory has no pre-tokenized corpus yet. Re-running with the
+    same output_dir resumes from the latest checkpoint. Returns the
+    per-intent agreement report of the student against the teacher on the
+    held-out utterances.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    corpus_prefix = os.path.join(output_dir, "corpus")
+    if os.path.exists(corpus_prefix + ".json"):
+        corpus = PretokenizedCorpus(corpus_prefix)
+        print(f"♻️ Reusing tokenized corpus ({len(corpus)} utterances)")
+    else:
+        corpus = build_corpus(texts, corpus_prefix, teacher.tokenizer, teacher.tokenizer_name,
+                              max_length=teacher.max_length)
+
+    targets_path = os.path.join(output_dir, TARGETS_FILENAME)
+    if not os.path.exists(targets_path):
+        generate_teacher_targets(teacher, corpus, targets_path, batch_size=batch_size * 2)
+    teacher_logits = np.load(targets_path, mmap_mode="r")
+
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILENAME)
+    checkpoint = torch.load(checkpoint_path, map_location="cpu") if os.path.exists(checkpoint_path) else None
+    if checkpoint is not None:
+        config = checkpoint['config']
+        student = MultiIntentClassifier(num_intents=checkpoint['num_intents'], config=config)
+        student.load_state_dict(checkpoint['state_dict'])
+        print(f"♻️ Resuming from epoch {checkpoint['epoch'] + 1}, step {checkpoint['step']}")
+    else:
+        config = student_config(teacher.load_model().bert.config, num_layers, hidden_size,
+                                num_attention_heads, intermediate_size)
+        student = build_student(teacher.load_model(), config, seed=seed)
+
+    order = list(range(len(corpus)))
+    random.Random(seed).shuffle(order)
+    split = int(len(order) * holdout)
+    held_out, train = np.array(sorted(order[:split]), dtype=np.int64), np.array(order[split:], dtype=np.int64)
+
+    optimizer = torch.optim.AdamW(student.parameters(), lr=lr)
+    if checkpoint is not None:
+        optimizer.load_state_dict(checkpoint['optimizer'])
+    start_epoch = checkpoint['epoch'] if checkpoint is not None else 0
+    start_step = checkpoint['step'] if checkpoint is not None else 0
+    losses = checkpoint['losses'] if checkpoint is not None else []
+
+    params = sum(p.numel() for p in student.parameters())
+    print(f"🧑‍🎓 Student: {config['num_hidden_layers']} layers, hidden {config['hidden_size']}, "
+          f"{params / 1e6:.1f}M parameters; {len(train)} train / {len(held_out)} held-out utterances")
+
+    lengths = corpus.lengths()
+    student.train()
+    for epoch in range(start_epoch, epochs):
+        batches = _epoch_batches(train, lengths, batch_size, epoch, seed)
+        step = start_step if epoch == start_epoch else 0
+        running = 0.0
+        for step_index in range(step, len(batches)):
+            indices = batches[step_index]
+            input_ids, attention_mask = corpus.pad(indices)
+            loss = distillation_loss(
+                student(input_ids=input_ids, attention_mask=attention_mask),
+                torch.from_numpy(np.asarray(teacher_logits[indices])),
+                temperature
+            )
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            running += loss.item()
+
+            if (step_index + 1) % checkpoint_every == 0:
+                _save_checkpoint(checkpoint_path, student, optimizer, config, epoch, step_index + 1, losses)
+                print(f"   💾 Epoch {epoch + 1} step {step_index + 1}/{len(batches)}: "
+                      f"loss {running / (step_index + 1 - step):.4f}")
+
+        losses.append(running / max(len(batches) - step, 1))
+        print(f"✅ Epoch {epoch + 1}/{epochs}: loss {losses[-1]:.4f}")
+        _save_checkpoint(checkpoint_path, student, optimizer, config, epoch + 1, 0, losses)
+    student.eval()
+
+    metadata = {
+        "num_intents": student.classifier.out_features,
+        "config": config,
+        "distilled_from": teacher.checkpoint_path,
+        "temperature": temperature,
+        "epochs": epochs
+    }
+    student_path = os.path.join(output_dir, STUDENT_FILENAME)
+    save_flat_weights(student.state_dict(), student_path, metadata=metadata)
+    print(f"✅ Student saved to {student_path}")
+
+    report = evaluate_student(student, corpus, teacher_logits, held_out, teacher.intent_labels,
+                              threshold=threshold, batch_size=batch_size * 2)
+    with open(os.path.join(output_dir, "agreement.json"), "w") as f:
+        json.dump(dict(report, flips=report['flips'][:100]), f, indent=2)
+    return report
+
+
+def evaluate_student(student, corpus, teacher_logits, indices, intent_labels, threshold=0.5,
+                     batch_size=64):
+    """Per-intent agreement of the student with the teacher on the given corpus rows"""
+    teacher_probabilities = torch.sigmoid(torch.from_numpy(np.asarray(teacher_logits[indices])))
+    student_probabilities = torch.empty_like(teacher_probabilities)
+    with inference_mode():
+        for start in range(0, len(indices), batch_size):
+            input_ids, attention_mask = corpus.pad(indices[start:start + batch_size])
+            student_probabilities[start:start + batch_size] = torch.sigmoid(
+                student(input_ids=input_ids, attention_mask=attention_mask)
+            )
+    return compare_probabilities(teacher_probabilities, student_probabilities, intent_labels,
+                                 threshold=threshold, texts=[int(i) for i in indices])
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Distill the model into a small student encoder")
+    parser.add_argument("input", help="Text file, one unlabeled utterance per line")
+    parser.add_argument("--output-dir", default="distilled")
+    parser.add_argument("--weights", help="Teacher weights in the memory-mapped format")
+    parser.add_argument("--num-layers", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, help="Default: the teacher's")
+    parser.add_argument("--num-heads", type=int)
+    parser.add_argument("--intermediate-size", type=int)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--holdout", type=float, default=0.1)
+    parser.add_argument("--checkpoint-every", type=int, default=200, help="Steps between checkpoints")
+    parser.add_argument("--threads", type=int, help="Intra-op threads for training")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        report = distill(
+            MultiIntentPredictor(weights_path=args.weights),
+            (line.strip() for line in f if line.strip()),
+            output_dir=args.output_dir,
+            num_layers=args.num_layers,
+            hidden_size=args.hidden_size,
+            num_attention_heads=args.num_heads,
+            intermediate_size=args.intermediate_size,
+            epochs=args.epochs,
+            batch_size=args.batch_size,
+            lr=args.lr,
+            temperature=args.temperature,
+            holdout=args.holdout,
+            checkpoint_every=args.checkpoint_every,
+            seed=args.seed,
+            num_threads=args.threads
+        )
+    print_comparison(dict(report, flips=report['flips'][:20]))
@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Confidence-based early exit through intermediate BERT layers
+
+Small intent heads (pooler-style dense + tanh + linear on the [CLS] state)
+are attached after some encoder layers. EarlyExitEngine runs the encoder
+layer by layer and lets a text leave at the first exit where every intent's
+probability is at least margin away from the threshold; texts that never
+get there run the full model and its own classifier, so their results are
+unchanged. Finished rows are dropped from the batch as it goes deeper.
+
+Heads are calibrated against the final head's outputs on unlabeled texts,
+and the margin is chosen on held-out texts as the smallest one whose
+early decisions match the full model at the requested agreement rate.
+
+    python early_exit.py utterances.txt --output exit_heads.pt
+    predictor = MultiIntentPredictor(early_exit_path="exit_heads.pt")
+"""
+import random
+import argparse
+import threading
+
+import torch
+import torch.nn as nn
+
+from inference_engines import inference_mode
+from metrics import METRICS
+
+EXIT_HEADS_PATH = "exit_heads.pt"
+DEFAULT_MARGINS = (0.05, 0.1, 0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45)
+
+
+def default_exit_layers(num_layers):
+    """Every second layer below the last one: 2, 4, ..., num_layers - 2"""
+    return list(range(2, num_layers, 2))
+
+
+def _embed(bert, input_ids, attention_mask):
+    """Embedding output and the additive attention mask the encoder layers expect"""
+    hidden = bert.embeddings(input_ids=input_ids)
+    mask = (1.0 - attention_mask[:, None, None, :].to(hidden.dtype)) * torch.finfo(hidden.dtype).min
+    return hidden, mask
+
+
+def _run_layer(layer, hidden, mask):
+    output = layer(hidden, mask)
+    # Older transformers versions return a tuple from every layer
+    return output[0] if isinstance(output, tuple) else output
+
+
+class ExitHead(nn.Module):
+    """Pooler-style head on the [CLS] state of an intermediate layer"""
+
+    def __init__(self, hidden_size, num_intents):
+        super(ExitHead, self).__init__()
+        self.dense = nn.Linear(hidden_size, hidden_size)
+        self.classifier = nn.Linear(hidden_size, num_intents)
+
+    def forward(self, hidden_states):
+        return self.score(hidden_states[:, 0])
+
+    def score(self, cls_states):
+        """Logits from [CLS] states alone"""
+        return self.classifier(torch.tanh(self.dense(cls_states)))
+
+
+class EarlyExitHeads(nn.Module):
+    """Exit heads keyed by encoder layer (1-based), with their exit rule"""
+
+    def __init__(self, exit_layers, hidden_size, num_intents, threshold=0.5, margin=0.2):
+        super(EarlyExitHeads, self).__init__()
+        self.exit_layers = sorted(exit_layers)
+        self.hidden_size = hidden_size
+        self.num_intents = num_intents
+        self.threshold = threshold
+        self.margin = margin
+        self.heads = nn.ModuleDict({
+            str(layer): ExitHead(hidden_size, num_intents) for layer in self.exit_layers
+        })
+
+    @classmethod
+    def for_model(cls, model, exit_layers=None, **kwargs):
+        """Heads sized for model, initialized from its pooler and classifier where possible"""
+        config = model.bert.config
+        heads = cls(
+            exit_layers or default_exit_layers(config.num_hidden_layers),
+            config.hidden_size,
+            model.classifier.out_features,
+            **kwargs
+        )
+        pooler = getattr(model.bert.pooler, "dense", None)
+        for head in heads.heads.values():
+            if type(pooler) is nn.Linear and not pooler.weight.is_meta:
+                head.dense.load_state_dict(pooler.state_dict())
+            if type(model.classifier) is nn.Linear and not model.classifier.weight.is_meta:
+                head.classifier.load_state_dict(model.classifier.state_dict())
+        return heads
+
+    def get(self, layer):
+        return self.heads[str(layer)] if str(layer) in self.heads else None
+
+    def confident(self, probabilities):
+        """Rows whose every intent is at least margin away from the threshold"""
+        return ((probabilities - self.threshold).abs() >= self.margin).all(dim=1)
+
+
+class EarlyExitEngine:
+    """Runs the encoder layer by layer and stops each text at its first confident exit
+
+    Calling the engine returns logits like any other engine; run also
+    returns the depth (number of encoder layers run) of every row, where the
+    full depth means the model's own head was used. Safe to share between
+    threads.
+    """
+
+    name = "early_exit"
+
+    def __init__(self, model, heads, margin=None):
+        self.model = model
+        self.heads = heads
+        if margin is not None:
+            heads.margin = margin
+        self.num_layers = len(model.bert.encoder.layer)
+        self.exit_counts = [0] * (self.num_layers + 1)
+        self._lock = threading.Lock()
+
+    def __call__(self, input_ids, attention_mask):
+        return self.run(input_ids, attention_mask)[0]
+
+    def run(self, input_ids, attention_mask, allow_exit=True):
+        """Logits and per-row exit depth for one padded batch
+
+        Without allow_exit every row runs the full model.
+        """
+        bert = self.model.bert
+        batch_size = input_ids.shape[0]
+        logits = torch.empty(batch_size, self.heads.num_intents)
+        exit_layers = torch.full((batch_size,), self.num_layers, dtype=torch.long)
+        active = torch.arange(batch_size)
+
+        with inference_mode():
+            hidden, mask = _embed(bert, input_ids, attention_mask)
+            lengths = attention_mask.sum(dim=1)
+
+            for depth, layer in enumerate(bert.encoder.layer, 1):
+                hidden = _run_layer(layer, hidden, mask)
+                head = self.heads.get(depth) if allow_exit and depth < self.num_layers else None
+                if head is None:
+                    continue
+
+                head_logits = head(hidden)
+                done = self.heads.confident(torch.sigmoid(head_logits))
+                if not done.any():
+                    continue
+                logits[active[done]] = head_logits[done]
+                exit_layers[active[done]] = depth
+
+                keep = ~done
+                if not keep.any():
+                    break
+                # Carry on with the undecided rows only, trimmed to their longest member
+                active, lengths = active[keep], lengths[keep]
+                longest = int(lengths.max())
+                hidden = hidden[keep, :longest]
+                mask = mask[keep][..., :longest]
+            else:
+                pooled = bert.pooler(hidden)
+                logits[active] = self.model.classifier(self.model.dropout(pooled))
+
+        depths = exit_layers.tolist()
+        with self._lock:
+            for depth in depths:
+                self.exit_counts[depth] += 1
+        for depth in depths:
+            METRICS.observe("multi_intent_exit_layer", depth,
+                            buckets=tuple(range(1, self.num_layers + 1)),
+                            help_text="Encoder layers run per text")
+        return logits, exit_layers
+
+    def warmup(self):
+        ids = torch.ones((1, 8), dtype=torch.long)
+        self(ids, torch.ones_like(ids))
+
+    def stats(self):
+        """Exit histogram, mean depth and the share of encoder layers skipped"""
+        with self._lock:
+            exit_counts = list(self.exit_counts)
+        total = sum(exit_counts)
+        mean_depth = (
+            sum(depth * count for depth, count in enumerate(exit_counts)) / total
+            if total else 0.0
+        )
+        return {
+            'texts': total,
+            'exit_counts': {depth: count for depth, count in enumerate(exit_counts) if count},
+            'mean_depth': mean_depth,
+            'layers_saved': 1 - mean_depth / self.num_layers if total else 0.0
+        }
+
+
+def _collect_features(predictor, encoded, exit_layers, batch_size):
+    """[CLS] states at every exit layer plus the full model's probabilities"""
+    model = predictor.load_model()
+    bert = model.bert
+    features = {layer: torch.empty(len(encoded), bert.config.hidden_size) for layer in exit_layers}
+    targets = torch.empty(len(encoded), model.classifier.out_features)
+
+    with inference_mode():
+        for bucket, input_ids, attention_mask in predictor._iter_padded(encoded, batch_size):
+            hidden, mask = _embed(bert, input_ids, attention_mask)
+            for depth, layer in enumerate(bert.encoder.layer, 1):
+                hidden = _run_layer(layer, hidden, mask)
+                if depth in features:
+                    features[depth][bucket] = hidden[:, 0]
+            targets[bucket] = torch.sigmoid(model.classifier(model.dropout(bert.pooler(hidden))))
+    return features, targets
+
+
+def _simulate_exits(heads, features, targets, margin):
+    """Agreement with the full model and mean depth if heads exited at margin"""
+    decided = torch.zeros(len(targets), dtype=torch.bool)
+    predictions = (targets > heads.threshold)
+    depths = torch.zeros(len(targets))
+    exits = {}
+    with inference_mode():
+        for layer in heads.exit_layers:
+            head = heads.get(layer)
+            probabilities = torch.sigmoid(head.score(features[layer]))
+            confident = ((probabilities - heads.threshold).abs() >= margin).all(dim=1) & ~decided
+            predictions[confident] = probabilities[confident] > heads.threshold
+            depths[confident] = layer
+            decided |= confident
+            exits[layer] = int(confident.sum())
+    return predictions, depths, decided, exits
+
+
+def calibrate_exit_heads(predictor, texts, exit_layers=None, epochs=5, batch_size=32, lr=1e-3,
+                         threshold=0.5, holdout=0.2, target_agreement=0.99, margins=DEFAULT_MARGINS,
+                         seed=0):
+    """Train exit heads to match the final head, then pick the exit margin
+
+    The encoder is frozen and run once; heads are trained with binary
+    cross-entropy against the full model's probabilities on (1 - holdout)
+    of the texts. On the held-out texts, the smallest margin whose early
+    decisions agree with the full model on at least target_agreement of
+    the texts is selected (the largest candidate if none reaches it).
+
+    Returns (heads, report).
+    """
+    model = predictor.load_model()
+    num_layers = model.bert.config.num_hidden_layers
+    heads = EarlyExitHeads.for_model(model, exit_layers, threshold=threshold)
+
+    texts = list(texts)
+    order = list(range(len(texts)))
+    random.Random(seed).shuffle(order)
+    split = max(1, int(len(texts) * holdout)) if len(texts) > 1 else 0
+    held_out, train = order[:split], order[split:]
+
+    print(f"🔬 Collecting layer states for {len(texts)} texts...")
+    features, targets = _collect_features(
+        predictor, predictor._encode(texts), heads.exit_layers, batch_size
+    )
+
+    generator = torch.Generator().manual_seed(seed)
+    train_index = torch.tensor(train, dtype=torch.long)
+    loss_fn = nn.BCEWithLogitsLoss()
+    heads.train()
+    for layer in heads.exit_layers:
+        head = heads.get(layer)
+        optimizer = torch.optim.Adam(head.parameters(), lr=lr)
+        for _ in range(epochs):
+            total = 0.0
+            train_index = train_index[torch.randperm(len(train_index), generator=generator)]
+            for start in range(0, len(train_index), batch_size):
+                batch = train_index[start:start + batch_size]
+                loss = loss_fn(head.score(features[layer][batch]), targets[batch])
+                optimizer.zero_grad()
+                loss.backward()
+                optimizer.step()
+                total += loss.item() * len(batch)
+        print(f"   ✅ Exit after layer {layer}: loss {total / max(len(train), 1):.4f}")
+    heads.eval()
+
+    held_index = torch.tensor(held_out, dtype=torch.long)
+    held_features = {layer: features[layer][held_index] for layer in heads.exit_layers}
+    held_targets = targets[held_index]
+    reference = held_targets > threshold
+
+    candidates = []
+    for margin in sorted(margins):
+        predictions, depths, decided, exits = _simulate_exits(heads, held_features, held_targets, margin)
+        depths[~decided] = num_layers
+        agreement = (predictions == reference).all(dim=1).float().mean().item() if len(held_out) else 1.0
+        candidates.append({
+            'margin': margin,
+            'agreement': agreement,
+            'mean_depth': depths.mean().item() if len(held_out) else float(num_layers),
+            'early_exit_rate': decided.float().mean().item() if len(held_out) else 0.0,
+            'exits': exits
+        })
+
+    chosen = next((c for c in candidates if c['agreement'] >= target_agreement), candidates[-1])
+    heads.margin = chosen['margin']
+    report = {
+        'num_layers': num_layers,
+        'exit_layers': heads.exit_layers,
+        'train_texts': len(train),
+        'held_out_texts': len(held_out),
+        'target_agreement': target_agreement,
+        'margin': heads.margin,
+        'candidates': candidates
+    }
+    return heads, report
+
+
+def print_calibration(report):
+    print(f"\n📊 Early exit calibration ({report['held_out_texts']} held-out texts, "
+          f"{report['num_layers']} layers)")
+    for c in report['candidates']:
+        marker = "👉" if c['margin'] == report['margin'] else "  "
+        print(f"   {marker} margin {c['margin']:.2f}: agreement {c['agreement']:.2%}, "
+              f"early exits {c['early_exit_rate']:.1%}, mean depth {c['mean_depth']:.2f}")
+    if not any(c['agreement'] >= report['target_agreement'] for c in report['candidates']):
+        print(f"⚠️ No margin reached {report['target_agreement']:.2%} agreement; "
+              f"using the most conservative one")
+
+
+def save_exit_heads(heads, path=EXIT_HEADS_PATH, report=None):
+    torch.save({
+        'state_dict': heads.state_dict(),
+        'exit_layers': heads.exit_layers,
+        'hidden_size': heads.hidden_size,
+        'num_intents': heads.num_intents,
+        'threshold': heads.threshold,
+        'margin': heads.margin,
+        'report': report
+    }, path)
+    print(f"✅ Exit heads saved to {path}")
+
+
+def load_exit_heads(path=EXIT_HEADS_PATH):
+    """Load heads written by save_exit_heads"""
+    checkpoint = torch.load(path, map_location='cpu')
+    heads = EarlyExitHeads(
+        checkpoint['exit_layers'],
+        checkpoint['hidden_size'],
+        checkpoint['num_intents'],
+        threshold=checkpoint['threshold'],
+        margin=checkpoint['margin']
+    )
+    heads.load_state_dict(checkpoint['state_dict'])
+    heads.eval()
+    return heads
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Calibrate early-exit heads against the full model")
+    parser.add_argument("input", help="Text file, one unlabeled utterance per line")
+    parser.add_argument("--output", default=EXIT_HEADS_PATH)
+    parser.add_argument("--weights", help="Memory-mapped weights from mmap_weights.py")
+    parser.add_argument("--exit-layers", help="Comma list of 1-based layers (default: every second)")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--holdout", type=float, default=0.2)
+    parser.add_argument("--target-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+
+    predictor = MultiIntentPredictor(weights_path=args.weights)
+    heads, report = calibrate_exit_heads(
+        predictor,
+        texts,
+        exit_layers=[int(v) for v in args.exit_layers.split(",")] if args.exit_layers else None,
+        epochs=args.epochs,
+        batch_size=args.batch_size,
+        lr=args.lr,
+        threshold=args.threshold,
+        holdout=args.holdout,
+        target_agreement=args.target_agreement
+    )
+    print_calibration(report)
+    save_exit_heads(heads, args.output, report)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+"""
+Persistent store of encoder embeddings for head-only rescoring and training
+
+The pooled [CLS] embedding (pooler_output) of every text is computed once
+and appended to a memory-mapped array, keyed by a hash of the normalized
+text. Threshold sweeps, rescoring with a retrained classifier and head-only
+fine-tuning then run on the stored embeddings and never touch BERT:
+
+    <prefix>.emb   float32 embeddings, one row per text
+    <prefix>.keys  16-byte text hashes, one per row
+    <prefix>.json  hidden size, row count and the model they came from
+
+    python embedding_store.py embed eval.txt --store embeddings/eval
+    python embedding_store.py train-head labeled.jsonl --store embeddings/train --output head.pt
+"""
+import os
+import json
+import hashlib
+import argparse
+import warnings
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from prediction_cache import normalize_text
+
+KEY_BYTES = 16
+
+
+def text_key(text, lowercase=True):
+    """Store key of a text: truncated SHA-256 of its normalized form"""
+    return hashlib.sha256(normalize_text(text, lowercase).encode("utf-8")).digest()[:KEY_BYTES]
+
+
+class EmbeddingStore:
+    """Append-only, memory-mapped embeddings keyed by text hash"""
+
+    def __init__(self, prefix, hidden_size=None, model_id=None):
+        self.prefix = prefix
+        if os.path.exists(prefix + ".json"):
+            with open(prefix + ".json") as f:
+                self.meta = json.load(f)
+            if hidden_size is not None and hidden_size != self.meta["hidden_size"]:
+                raise ValueError(
+                    f"Store {prefix} holds {self.meta['hidden_size']}-d embeddings, not {hidden_size}-d"
+                )
+            if model_id is not None and self.meta["model_id"] not in (None, model_id):
+                raise ValueError(
+                    f"Store {prefix} was built with model {self.meta['model_id']}, not {model_id}"
+                )
+        else:
+            if hidden_size is None:
+                raise FileNotFoundError(f"No embedding store at {prefix}; pass hidden_size to create one")
+            directory = os.path.dirname(prefix)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.meta = {"version": 1, "hidden_size": hidden_size, "model_id": model_id, "count": 0}
+            open(prefix + ".emb", "wb").close()
+            open(prefix + ".keys", "wb").close()
+            self._write_meta()
+        self._open()
+
+    def _open(self):
+        count = self.meta["count"]
+        # Rows past count are leftovers of an interrupted append
+        for suffix, row_bytes in ((".emb", 4 * self.meta["hidden_size"]), (".keys", KEY_BYTES)):
+            if os.path.getsize(self.prefix + suffix) != count * row_bytes:
+                with open(self.prefix + suffix, "r+b") as f:
+                    f.truncate(count * row_bytes)
+        self.embeddings = (
+            np.memmap(self.prefix + ".emb", dtype=np.float32, mode="r",
+                      shape=(count, self.meta["hidden_size"]))
+            if count else np.zeros((0, self.meta["hidden_size"]), dtype=np.float32)
+        )
+        with open(self.prefix + ".keys", "rb") as f:
+            raw = f.read()
+        self.index = {raw[row * KEY_BYTES:(row + 1) * KEY_BYTES]: row for row in range(count)}
+
+    def _write_meta(self):
+        with open(self.prefix + ".json.part", "w") as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(self.prefix + ".json.part", self.prefix + ".json")
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def rows(self, keys):
+        """Row of every key, or -1 where the key is not stored"""
+        return np.array([self.index.get(key, -1) for key in keys], dtype=np.int64)
+
+    def add(self, keys, embeddings):
+        """Append embeddings for keys that are not stored yet"""
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        fresh = {}
+        for key, row in zip(keys, embeddings):
+            if key not in self.index and key not in fresh:
+                fresh[key] = row
+        if not fresh:
+            return 0
+
+        with open(self.prefix + ".emb", "ab") as f:
+            f.write(np.stack(list(fresh.values())).tobytes())
+        with open(self.prefix + ".keys", "ab") as f:
+            f.write(b"".join(fresh))
+        self.meta["count"] += len(fresh)
+        self._write_meta()
+        self._open()
+        return len(fresh)
+
+    def get(self, keys):
+        """[len(keys), hidden_size] tensor of stored embeddings; every key must be present"""
+        rows = self.rows(keys)
+        if (rows < 0).any():
+            raise KeyError(f"{int((rows < 0).sum())} texts have no stored embedding")
+        return torch.from_numpy(np.asarray(self.embeddings[rows]))
+
+
+def model_id(predictor):
+    """Identity of the predictor's weights: the checkpoint fingerprint when known"""
+    from inference_engines import checkpoint_fingerprint
+
+    predictor.load_model()
+    if predictor.checkpoint_path and os.path.exists(predictor.checkpoint_path):
+        return checkpoint_fingerprint(predictor.checkpoint_path, predictor.engine_cache_dir)
+    return None
+
+
+def open_store(prefix, predictor):
+    """Open or create the store at prefix for the predictor's encoder"""
+    model = predictor.load_model()
+    return EmbeddingStore(prefix, hidden_size=model.bert.config.hidden_size, model_id=model_id(predictor))
+
+
+def embed_texts(predictor, texts, store, batch_size=32):
+    """Embeddings of texts from the store, running the encoder only for texts it lacks"""
+    texts = list(texts)
+    lowercase = getattr(predictor.tokenizer, 'do_lower_case', False)
+    keys = [text_key(text, lowercase) for text in texts]
+
+    missing = {}
+    for text, key in zip(texts, keys):
+        if key not in store and key not in missing:
+            missing[key] = text
+    if missing:
+        print(f"🧮 Encoding {len(missing)} new texts ({len(texts) - len(missing)} already stored)...")
+        store.add(list(missing), predictor.embed_many(list(missing.values()), batch_size=batch_size))
+    return store.get(keys)
+
+
+def head_probabilities(embeddings, classifier):
+    """Sigmoid outputs of a classifier head on stored embeddings (no dropout)"""
+    with torch.no_grad():
+        return torch.sigmoid(classifier(embeddings))
+
+
+def rescore(predictor, texts, store, threshold=0.5, classifier=None, batch_size=32):
+    """PredictionResult objects for texts computed from stored embeddings
+
+    classifier defaults to the predictor's own head; pass a retrained
+    nn.Linear (see train_head) to evaluate it without re-running BERT.
+    threshold may also be a per-intent sequence or dict.
+    """
+    from inference_example import PredictionResult
+
+    texts = list(texts)
+    if classifier is None:
+        classifier = predictor.load_model().classifier
+    probabilities = head_probabilities(embed_texts(predictor, texts, store, batch_size), classifier)
+    intents = predictor._decode(probabilities, threshold)
+    return [
+        PredictionResult(text, text_intents, predictor._probability_dict(row))
+        for text, text_intents, row in zip(texts, intents, probabilities.tolist())
+    ]
+
+
+def train_head(embeddings, labels, init=None, epochs=20, batch_size=256, lr=1e-3,
+               weight_decay=0.01, holdout=0.1, seed=0):
+    """Fine-tune a classifier head on stored embeddings against multi-hot labels
+
+    init is the nn.Linear to start from (usually the current head; a
+    quantized head cannot be used and is ignored). Returns
+    the trained head and a report with the held-out loss and exact-match rate.
+    """
+    embeddings = torch.as_tensor(embeddings, dtype=torch.float32)
+    labels = torch.as_tensor(labels, dtype=torch.float32)
+    head = nn.Linear(embeddings.shape[1], labels.shape[1])
+    if type(init) is nn.Linear:
+        head.load_state_dict({name: tensor.detach().clone() for name, tensor in init.state_dict().items()})
+
+    generator = torch.Generator().manual_seed(seed)
+    order = torch.randperm(len(embeddings), generator=generator)
+    split = int(len(order) * holdout)
+    held_out, train = order[:split], order[split:]
+
+    loss_fn = nn.BCEWithLogitsLoss()
+    optimizer = torch.optim.AdamW(head.parameters(), lr=lr, weight_decay=weight_decay)
+    for epoch in range(epochs):
+        shuffled = train[torch.randperm(len(train), generator=generator)]
+        total = 0.0
+        for start in range(0, len(shuffled), batch_size):
+            batch = shuffled[start:start + batch_size]
+            loss = loss_fn(head(embeddings[batch]), labels[batch])
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total += loss.item() * len(batch)
+        print(f"   Epoch {epoch + 1}/{epochs}: loss {total / max(len(train), 1):.4f}")
+
+    report = {'train_examples': len(train), 'held_out_examples': len(held_out)}
+    if len(held_out):
+        with torch.no_grad():
+            logits = head(embeddings[held_out])
+            report['held_out_loss'] = loss_fn(logits, labels[held_out]).item()
+            report['held_out_exact_match'] = (
+                ((logits > 0) == (labels[held_out] > 0.5)).all(dim=1).float().mean().item()
+            )
+    return head, report
+
+
+def save_head(head, path, labels=None, thresholds=None):
+    """Save a head, optionally with its label names and decision thresholds"""
+    torch.save({'state_dict': head.state_dict(), 'in_features': head.in_features,
+                'out_features': head.out_features, 'labels': labels,
+                'thresholds': thresholds}, path)
+    print(f"✅ Head saved to {path}")
+
+
+def read_head(path):
+    """(head, labels, thresholds) from a file written by save_head; labels/thresholds may be None"""
+    checkpoint = torch.load(path, map_location='cpu')
+    head = nn.Linear(checkpoint['in_features'], checkpoint['out_features'])
+    head.load_state_dict(checkpoint['state_dict'])
+    head.eval()
+    return head, checkpoint.get('labels'), checkpoint.get('thresholds')
+
+
+def load_head(path):
+    return read_head(path)[0]
+
+
+def replace_head(predictor, head):
+    """Serve predictor with a new classifier head
+
+    The engine is rebuilt without the on-disk graph cache (it is keyed by
+    the original checkpoint) and the exact and semantic probability caches
+    are cleared, since both hold outputs of the old head. Holds the
+    predictor's lock, so requests in other threads pick up the new engine
+    rather than the old one. Early exit is turned off, since its exit heads
+    were calibrated against the old head; recalibrate them with
+    early_exit.py and set early_exit_path again.
+    """
+    with predictor._lock:
+        if predictor.early_exit_path is not None:
+            warnings.warn(
+                f"Early exit disabled: the heads in {predictor.early_exit_path} were calibrated "
+                f"against the old classifier and must be recalibrated"
+            )
+            predictor.early_exit_path = None
+        model = predictor.load_model()
+        # Drop the engine first: get_engine then waits on the lock until the head is in place
+        predictor.engine = None
+        predictor.checkpoint_path = None
+        model.classifier = head.eval()
+        if predictor.cache is not None:
+            predictor.cache.clear()
+        if predictor.semantic_cache is not None:
+            predictor.semantic_cache.clear()
+    return predictor
+
+
+def _read_labeled(path, intent_labels):
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            row = [0.0] * len(intent_labels)
+            for intent in record["intents"]:
+                row[intent_labels.index(intent)] = 1.0
+            texts.append(record["text"])
+            labels.append(row)
+    return texts, labels
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Embedding store for head-only rescoring and training")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    embed_parser = subparsers.add_parser("embed", help="Add embeddings for a text file (one per line)")
+    embed_parser.add_argument("input")
+
+    train_parser = subparsers.add_parser("train-head", help="Fine-tune the head on labeled JSONL")
+    train_parser.add_argument("input", help='JSONL lines like {"text": ..., "intents": ["booking"]}')
+    train_parser.add_argument("--output", default="head.pt")
+    train_parser.add_argument("--epochs", type=int, default=20)
+    train_parser.add_argument("--lr", type=float, default=1e-3)
+    train_parser.add_argument("--labels", help="Comma list of label names (default: the model's intents)")
+
+    for sub in (embed_parser, train_parser):
+        sub.add_argument("--store", required=True, help="Store prefix")
+        sub.add_argument("--weights", help="Memory-mapped weights from mmap_weights.py")
+        sub.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    predictor = MultiIntentPredictor(weights_path=args.weights)
+    store = open_store(args.store, predictor)
+
+    if args.command == "embed":
+        with open(args.input, encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        embed_texts(predictor, texts, store, batch_size=args.batch_size)
+        print(f"✅ Store {args.store} holds {len(store)} embeddings")
+    else:
+        label_names = args.labels.split(",") if args.labels else predictor.intent_labels
+        texts, labels = _read_labeled(args.input, label_names)
+        embeddings = embed_texts(predictor, texts, store, batch_size=args.batch_size)
+        # A new label set starts from scratch; the model's own labels start from its head
+        init = predictor.model.classifier if label_names == predictor.intent_labels else None
+        head, report = train_head(embeddings, labels, init=init, epochs=args.epochs, lr=args.lr)
+        print(f"📊 {json.dumps(report)}")
+        save_head(head, args.output, labels=label_names)
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Agreement checks between two versions of the Multi-Intent NLP Model
+(e.g. fp32 vs quantized, teacher vs student, full vs pruned)
+"""
+import torch
+
+
+def compare_probabilities(reference, candidate, intent_labels, threshold=0.5, texts=None):
+    """Compare two [num_texts, num_intents] probability tensors
+
+    Reports the absolute deviation overall and per intent, and every
+    decision that flips at the threshold.
+    """
+    reference = torch.as_tensor(reference, dtype=torch.float32)
+    candidate = torch.as_tensor(candidate, dtype=torch.float32)
+    deviation = (reference - candidate).abs()
+    flipped = (reference > threshold) != (candidate > threshold)
+
+    per_intent = {}
+    for i, label in enumerate(intent_labels):
+        per_intent[label] = {
+            'max_deviation': deviation[:, i].max().item() if len(deviation) else 0.0,
+            'agreement': 1.0 - flipped[:, i].float().mean().item() if len(flipped) else 1.0,
+            'flips': int(flipped[:, i].sum().item())
+        }
+
+    flips = []
+    for row, col in flipped.nonzero().tolist():
+        flips.append({
+            'text': texts[row] if texts is not None else row,
+            'intent': intent_labels[col],
+            'reference': reference[row, col].item(),
+            'candidate': candidate[row, col].item()
+        })
+
+    return {
+        'num_texts': len(reference),
+        'threshold': threshold,
+        'max_abs_deviation': deviation.max().item() if deviation.numel() else 0.0,
+        'mean_abs_deviation': deviation.mean().item() if deviation.numel() else 0.0,
+        'exact_match_rate': 1.0 - flipped.any(dim=1).float().mean().item() if len(flipped) else 1.0,
+        'per_intent': per_intent,
+        'flips': flips
+    }
+
+
+def compare_predictors(reference, candidate, texts, threshold=0.5, batch_size=32):
+    """Score texts with two MultiIntentPredictor instances (bypassing their caches) and compare"""
+    texts = list(texts)
+    reference_probabilities = reference._score_encoded(reference._encode(texts), batch_size=batch_size)
+    candidate_probabilities = candidate._score_encoded(candidate._encode(texts), batch_size=batch_size)
+    return compare_probabilities(
+        reference_probabilities,
+        candidate_probabilities,
+        reference.intent_labels,
+        threshold=threshold,
+        texts=texts
+    )
+
+
+def print_comparison(report):
+    """Print a comparison report in the same style as the test scripts"""
+    print(f"📊 Compared {report['num_texts']} texts at threshold {report['threshold']}")
+    print(f"   Max deviation:  {report['max_abs_deviation']:.4f}")
+    print(f"   Mean deviation: {report['mean_abs_deviation']:.4f}")
+    print(f"   Exact match:    {report['exact_match_rate']:.1%}")
+    for label, stats in report['per_intent'].items():
+        print(f"   {label:>13}: max dev {stats['max_deviation']:.4f}, "
+              f"agreement {stats['agreement']:.1%}, flips {stats['flips']}")
+    if report['flips']:
+        print(f"⚠️ {len(report['flips'])} decisions flipped at the threshold:")
+        for flip in report['flips']:
+            print(f"   '{flip['text']}' {flip['intent']}: "
+                  f"{flip['reference']:.3f} -> {flip['candidate']:.3f}")
+    else:
+        print("✅ No decisions flipped at the threshold")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Inference engines for MultiIntentPredictor
+
+An engine maps padded (input_ids, attention_mask) batches to logits.
+EagerEngine runs the nn.Module directly; TracedEngine runs a traced
+TorchScript graph of MultiIntentClassifier.forward per sequence-length
+bucket. Graphs read the model's own parameters, so they add no copy of the
+weights; only the graph code is cached on disk, per checkpoint fingerprint
+and bucket.
+"""
+import os
+import json
+import hashlib
+import warnings
+
+import torch
+
+ENGINE_CACHE_DIR = ".engine_cache"
+SEQ_BUCKETS = (16, 32, 64, 128)
+
+inference_mode = getattr(torch, "inference_mode", torch.no_grad)
+
+
+def checkpoint_fingerprint(path, cache_dir=ENGINE_CACHE_DIR):
+    """SHA-256 of a checkpoint file, memoized on (size, mtime) in the cache dir"""
+    from reconstruct_from_github import file_sha256
+
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    index_path = os.path.join(cache_dir, "fingerprints.json")
+    try:
+        with open(index_path) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+
+    entry = index.get(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+        return entry["sha256"]
+
+    digest = file_sha256(path)
+    index[path] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest}
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent=2)
+    return digest
+
+
+class EagerEngine:
+    """Runs the model module directly under inference mode"""
+
+    name = "eager"
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, input_ids, attention_mask):
+        with inference_mode():
+            return self.model(input_ids=input_ids, attention_mask=attention_mask)
+
+    def warmup(self):
+        ids = torch.ones((1, 8), dtype=torch.long)
+        self(ids, torch.ones_like(ids))
+
+
+def _tensor_slots(module):
+    """(submodule, attribute, qualified name, tensor) of every parameter and buffer"""
+    for prefix, submodule in module.named_modules():
+        owned = list(submodule.named_parameters(recurse=False)) + list(submodule.named_buffers(recurse=False))
+        for name, tensor in owned:
+            yield submodule, name, f"{prefix}.{name}" if prefix else name, tensor
+
+
+def _save_graph_code(graph, path):
+    """Save a traced graph without its weights
+
+    Every parameter and buffer is swapped for a one-element expanded view
+    while saving, so the file holds the code and shapes but no weight data.
+    """
+    slots = list(_tensor_slots(graph))
+    try:
+        for submodule, name, _, tensor in slots:
+            setattr(submodule, name, torch.zeros((), dtype=tensor.dtype).expand(tensor.shape))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        torch.jit.save(graph, path + ".part")
+        os.replace(path + ".part", path)
+    finally:
+        for submodule, name, _, tensor in slots:
+            setattr(submodule, name, tensor)
+
+
+def _bind_tensors(graph, model):
+    """Point a loaded graph's parameters and buffers at the model's tensors"""
+    live = dict(model.named_parameters())
+    live.update(model.named_buffers())
+    for submodule, name, qualified_name, tensor in list(_tensor_slots(graph)):
+        if qualified_name not in live or live[qualified_name].shape != tensor.shape:
+            raise RuntimeError(f"Cached graph does not match the model at {qualified_name}")
+        setattr(submodule, name, live[qualified_name])
+
+
+class TracedEngine:
+    """Runs traced TorchScript graphs, one per sequence-length bucket
+
+    Batches are padded up to the next bucket; longer inputs fall back to the
+    eager model. Graphs are not frozen: every bucket shares the model's
+    parameters instead of holding its own constant copy. They are saved
+    under cache_dir keyed by fingerprint (the checkpoint hash) and bucket
+    with the weights stripped out, and later processes bind the live
+    parameters after loading instead of tracing again. Without a
+    fingerprint graphs are only kept in memory.
+    """
+
+    name = "traced"
+
+    def __init__(self, model, fingerprint=None, cache_dir=ENGINE_CACHE_DIR,
+                 buckets=SEQ_BUCKETS, pad_token_id=0):
+        self.model = model
+        self.fingerprint = fingerprint
+        self.cache_dir = cache_dir
+        self.buckets = tuple(sorted(buckets))
+        self.pad_token_id = pad_token_id
+        self.graphs = {}
+        self.eager = EagerEngine(model)
+
+    def _graph_path(self, bucket):
+        # "code": weight-free graphs; older caches held frozen copies of the weights
+        key = hashlib.sha256(f"{self.fingerprint}|{torch.__version__}|code".encode()).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"traced_{key}_seq{bucket}.pt")
+
+    def _graph(self, bucket):
+        graph = self.graphs.get(bucket)
+        if graph is not None:
+            return graph
+
+        path = self._graph_path(bucket) if self.fingerprint else None
+        if path and os.path.exists(path):
+            graph = torch.jit.load(path, map_location="cpu")
+            _bind_tensors(graph, self.model)
+        else:
+            example_ids = torch.full((2, bucket), self.pad_token_id, dtype=torch.long)
+            example_mask = torch.ones_like(example_ids)
+            self.model.eval()
+            with torch.no_grad(), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                graph = torch.jit.trace(self.model, (example_ids, example_mask), check_trace=False)
+            if path:
+                _save_graph_code(graph, path)
+
+        self.graphs[bucket] = graph
+        return graph
+
+    def _bucket(self, seq_len):
+        for bucket in self.buckets:
+            if seq_len <= bucket:
+                return bucket
+        return None
+
+    def __call__(self, input_ids, attention_mask):
+        batch_size, seq_len = input_ids.shape
+        bucket = self._bucket(seq_len)
+        if bucket is None:
+            return self.eager(input_ids, attention_mask)
+
+        if seq_len < bucket:
+            padded_ids = torch.full((batch_size, bucket), self.pad_token_id, dtype=input_ids.dtype)
+            padded_mask = torch.zeros((batch_size, bucket), dtype=attention_mask.dtype)
+            padded_ids[:, :seq_len] = input_ids
+            padded_mask[:, :seq_len] = attention_mask
+            input_ids, attention_mask = padded_ids, padded_mask
+
+        with inference_mode():
+            return self._graph(bucket)(input_ids, attention_mask)
+
+    def warmup(self, tolerance=1e-4):
+        """Build (or load) every bucket graph and check it against the eager model"""
+        for bucket in self.buckets:
+            graph = self._graph(bucket)
+            for batch_size in (1, 3):
+                ids = torch.randint(1, self.model.bert.config.vocab_size, (batch_size, bucket))
+                mask = torch.ones_like(ids)
+                mask[-1, bucket // 2:] = 0
+                with inference_mode():
+                    expected = self.model(input_ids=ids, attention_mask=mask)
+                    actual = graph(ids, mask)
+                if not torch.allclose(expected, actual, atol=tolerance):
+                    raise RuntimeError(f"Traced graph for length {bucket} does not match the eager model")
+
+
+ENGINES = {
+    "eager": EagerEngine,
+    "traced": TracedEngine
+}
+
+
+def create_engine(model, engine="auto", checkpoint_path=None, cache_dir=ENGINE_CACHE_DIR,
+                  pad_token_id=0, shared_weights=False):
+    """Create and warm up an engine for model
+
+    engine="auto" uses the traced engine when tracing succeeds and its
+    output matches the eager model, and falls back to eager otherwise.
+    With shared_weights (e.g. memory-mapped weights), auto picks eager so
+    startup stays a plain mmap with nothing to trace or load.
+    """
+    if engine == "eager" or (engine == "auto" and shared_weights):
+        selected = EagerEngine(model)
+        selected.warmup()
+        return selected
+
+    if engine not in ("auto", "traced"):
+        raise ValueError(f"Unknown engine '{engine}', expected one of: auto, {', '.join(ENGINES)}")
+
+    try:
+        fingerprint = None
+        if checkpoint_path is not None and os.path.exists(checkpoint_path):
+            # Packed int8 weights are not parameters and cannot be stripped
+            # from a saved graph, so quantized graphs stay in memory
+            if not getattr(model, "is_quantized", False):
+                fingerprint = checkpoint_fingerprint(checkpoint_path, cache_dir)
+        selected = TracedEngine(model, fingerprint=fingerprint, cache_dir=cache_dir,
+                                pad_token_id=pad_token_id)
+        selected.warmup()
+        return selected
+    except Exception as e:
+        if engine == "traced":
+            raise
+        print(f"⚠️ Traced engine unavailable ({e}), using eager mode")
+        selected = EagerEngine(model)
+        selected.warmup()
+        return selected
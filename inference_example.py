@@ -2,90 +2,564 @@
 """
 Complete inference example for Multi-Intent NLP Model
 """
+import threading
+import warnings
+
 import torch
 from transformers import AutoTokenizer
-from model_architecture import MultiIntentClassifier
+from model_architecture import build_model_from_state_dict
 from safe_model_loader import MultiIntentModel
+from prediction_cache import LRUProbabilityCache, normalize_text
+from inference_engines import inference_mode
+from metrics import METRICS
+from decoding import decode_batch, threshold_vector
 import numpy as np
 
+DEFAULT_INTENT_LABELS = [
+    "booking", "inquiry", "complaint", "support", "feedback",
+    "payment", "cancellation", "modification", "confirmation", "other"
+]
+
+# How window probabilities of one long text are combined into one row
+WINDOW_REDUCTIONS = {
+    'max': lambda rows: rows.max(dim=0).values,
+    'mean': lambda rows: rows.mean(dim=0)
+}
+
+class PredictionResult:
+    """Thresholded intents and the full probability vector for one text"""
+    
+    def __init__(self, text, intents, probabilities, exit_layer=None):
+        self.text = text
+        self.intents = intents
+        self.probabilities = probabilities
+        self.exit_layer = exit_layer
+    
+    def to_dict(self):
+        result = {
+            'text': self.text,
+            'intents': self.intents,
+            'probabilities': self.probabilities
+        }
+        if self.exit_layer is not None:
+            result['exit_layer'] = self.exit_layer
+        return result
+    
+    def __repr__(self):
+        names = [r['intent'] for r in self.intents]
+        return f"PredictionResult(text={self.text!r}, intents={names})"
+
 class MultiIntentPredictor:
-    def __init__(self, num_intents=10):
+    def __init__(self, num_intents=10, max_length=128, cache_size=1024, weights_path=None,
+                 model_config=None, tokenizer_name="bert-base-uncased", quantized=False,
+                 quantized_path=None, engine="auto", engine_cache_dir=".engine_cache",
+                 early_exit_path=None, exit_margin=None, intent_labels=None, semantic_cache=None):
         self.num_intents = num_intents
+        self.max_length = max_length
+        self.weights_path = weights_path
+        self.model_config = model_config
+        self.tokenizer_name = tokenizer_name
+        self.quantized = quantized or quantized_path is not None
+        self.quantized_path = quantized_path
+        self.engine_name = engine
+        self.engine_cache_dir = engine_cache_dir
+        self.early_exit_path = early_exit_path
+        self.exit_margin = exit_margin
+        self.engine = None
         self.model = None
-        self.tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased")
-        self.intent_labels = [
-            "booking", "inquiry", "complaint", "support", "feedback",
-            "payment", "cancellation", "modification", "confirmation", "other"
-        ]
+        self.checkpoint_path = None
+        self.tokenizer = AutoTokenizer.from_pretrained(tokenizer_name)
+        self.cache = LRUProbabilityCache(cache_size) if cache_size else None
+        # Optional semantic_cache.SemanticCache, consulted after exact-cache misses
+        self.semantic_cache = semantic_cache
+        # Guards the one-time model load and engine creation (re-entrant:
+        # get_engine calls load_model)
+        self._lock = threading.RLock()
+        # Older tokenizers releases fail with "Already borrowed" when one
+        # fast tokenizer is called from several threads at once
+        self._tokenizer_lock = threading.Lock()
+        self.intent_labels = list(intent_labels or DEFAULT_INTENT_LABELS)
+    
+    def __getstate__(self):
+        # Locks cannot be pickled or shared with copies; each copy gets its own
+        state = dict(self.__dict__)
+        del state['_lock'], state['_tokenizer_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+        self._tokenizer_lock = threading.Lock()
     
     def load_model(self):
-        """Load the trained model"""
-        if self.model is None:
-            loader = MultiIntentModel()
-            loaded_data = loader.load()
-            
-            # Check if loaded_data is a model or a state dict
-            if isinstance(loaded_data, torch.nn.Module):
-                self.model = loaded_data
-            else:
-                # If it's a state dict, create model and load weights
-                self.model = MultiIntentClassifier(num_intents=self.num_intents)
-                self.model.load_state_dict(loaded_data)
+        """Load the trained model
+        
+        With weights_path set, the model is built on the memory-mapped
+        weights written by mmap_weights.convert_checkpoint. With quantized
+        set, Linear layers are dynamically quantized to int8 after loading;
+        quantized_path loads a model saved by quantization.save_quantized_model.
+        
+        Safe to call from several threads: the model is loaded once, and
+        other threads wait for it instead of loading their own copy.
+        """
+        model = self.model
+        if model is not None and (not self.quantized or getattr(model, 'is_quantized', False)):
+            return model
+        
+        with self._lock:
+            if self.model is None:
+                with METRICS.time("model_load"):
+                    self.model = self._load_model()
             
-            self.model.eval()
-        return self.model
+            if self.quantized and not getattr(self.model, 'is_quantized', False):
+                from quantization import quantize_model
+                self.model = quantize_model(self.model, inplace=True)
+            return self.model
     
-    def predict(self, text, threshold=0.5):
-        """Predict intents for given text"""
-        self.load_model()
-        
-        # Tokenize input
-        inputs = self.tokenizer(
-            text, 
-            padding=True, 
-            truncation=True, 
-            max_length=128, 
-            return_tensors="pt"
-        )
+    def _load_model(self):
+        if self.quantized_path is not None:
+            from quantization import load_quantized_model
+            self.checkpoint_path = self.quantized_path
+            return load_quantized_model(self.quantized_path)
+        
+        if self.weights_path is not None:
+            from mmap_weights import load_mmap_model
+            self.checkpoint_path = self.weights_path
+            return load_mmap_model(
+                self.weights_path,
+                num_intents=self.num_intents,
+                config=self.model_config
+            )
         
-        # Predict
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probabilities = torch.sigmoid(outputs)
-            predictions = (probabilities > threshold).int()
+        loader = MultiIntentModel()
+        loaded_data = loader.load()
+        self.checkpoint_path = loader.model_path
         
-        # Convert to readable format
-        results = []
-        for i in range(self.num_intents):
-            if predictions[0][i] == 1:
-                results.append({
-                    'intent': self.intent_labels[i],
-                    'confidence': probabilities[0][i].item(),
-                    'label_index': i
-                })
+        # Check if loaded_data is a model or a state dict
+        if isinstance(loaded_data, torch.nn.Module):
+            model = loaded_data
+        else:
+            # If it's a state dict, build the architecture from its config
+            # and fill in the weights (no pretrained download)
+            model = build_model_from_state_dict(
+                loaded_data,
+                num_intents=self.num_intents,
+                config=self.model_config or "bert-base-uncased"
+            )
         
-        return results
+        return model.eval()
     
-    def predict_proba(self, text):
-        """Get probability scores for all intents"""
-        self.load_model()
-        
-        inputs = self.tokenizer(
-            text, 
-            padding=True, 
-            truncation=True, 
-            max_length=128, 
-            return_tensors="pt"
+    def get_engine(self):
+        """Inference engine for the current model, created and warmed up on first use
+        
+        engine="auto" picks the traced graphs when they are available and
+        falls back to eager mode (see inference_engines.create_engine);
+        memory-mapped weights (weights_path) always run eagerly under auto.
+        With early_exit_path set, heads calibrated by early_exit.py let
+        confident texts stop at an intermediate layer instead, for calls
+        decoded at the calibration threshold (see _allow_exit).
+        """
+        model = self.load_model()
+        engine = self.engine
+        if engine is not None and engine.model is model:
+            return engine
+        
+        with self._lock:
+            if self.engine is None or self.engine.model is not self.model:
+                with METRICS.time("engine_warmup"):
+                    self.engine = self._create_engine()
+            return self.engine
+    
+    def _create_engine(self):
+        if self.early_exit_path is not None:
+            from early_exit import EarlyExitEngine, load_exit_heads
+            return EarlyExitEngine(
+                self.model,
+                load_exit_heads(self.early_exit_path),
+                margin=self.exit_margin
+            )
+        
+        from inference_engines import create_engine
+        return create_engine(
+            self.model,
+            engine=self.engine_name,
+            checkpoint_path=self.checkpoint_path,
+            cache_dir=self.engine_cache_dir,
+            pad_token_id=self.tokenizer.pad_token_id or 0,
+            shared_weights=self.weights_path is not None
         )
+    
+    def _encode(self, texts):
+        """Tokenize texts without padding so each batch can be padded on its own"""
+        texts = list(texts)
+        with METRICS.time("tokenize"), self._tokenizer_lock:
+            return self.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.max_length
+            )["input_ids"]
+    
+    def _encode_windows(self, texts, stride=None):
+        """Tokenize texts in full and cut each into overlapping max_length windows
+        
+        Returns the window token lists of all texts back to back, and the
+        number of windows of each text. stride is the number of tokens
+        shared by consecutive windows (default: half a window).
+        """
+        if stride is None:
+            stride = (self.max_length - self.tokenizer.num_special_tokens_to_add()) // 2
+        texts = list(texts)
+        with METRICS.time("tokenize"), self._tokenizer_lock:
+            encoded = self.tokenizer(
+                texts,
+                truncation=True,
+                max_length=self.max_length,
+                stride=stride,
+                return_overflowing_tokens=True
+            )
+        counts = np.bincount(encoded["overflow_to_sample_mapping"], minlength=len(texts))
+        return encoded["input_ids"], counts.tolist()
+    
+    def _iter_padded(self, encoded, batch_size=32):
+        """Yield (indices, input_ids, attention_mask) batches of similar length"""
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        pad_id = self.tokenizer.pad_token_id or 0
+        
+        for start in range(0, len(order), batch_size):
+            bucket = order[start:start + batch_size]
+            longest = max(len(encoded[i]) for i in bucket)
+            
+            input_ids = torch.full((len(bucket), longest), pad_id, dtype=torch.long)
+            attention_mask = torch.zeros((len(bucket), longest), dtype=torch.long)
+            for row, i in enumerate(bucket):
+                ids = encoded[i]
+                input_ids[row, :len(ids)] = torch.tensor(ids, dtype=torch.long)
+                attention_mask[row, :len(ids)] = 1
+            yield bucket, input_ids, attention_mask
+    
+    def _score_encoded(self, encoded, batch_size=32, exit_layers=None, allow_exit=True):
+        """Run the model over token id lists, grouped into length buckets
         
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-            probabilities = torch.sigmoid(outputs)
+        Sequences are sorted by length and every batch is padded only to
+        its longest member. Probabilities are returned in input order.
+        If given, exit_layers is filled with the encoder depth of each text.
+        Without allow_exit, an early-exit engine runs every layer.
+        """
+        engine = self.get_engine()
+        probabilities = torch.empty(len(encoded), self.num_intents)
+        num_layers = self.model.bert.config.num_hidden_layers
         
-        return {
-            self.intent_labels[i]: probabilities[0][i].item()
-            for i in range(self.num_intents)
+        with inference_mode():
+            for bucket, input_ids, attention_mask in self._iter_padded(encoded, batch_size):
+                METRICS.observe("multi_intent_batch_size", len(bucket),
+                                help_text="Texts per forward pass")
+                with METRICS.time("forward"):
+                    if engine.name == "early_exit":
+                        outputs, depths = engine.run(input_ids, attention_mask, allow_exit=allow_exit)
+                    else:
+                        outputs, depths = engine(input_ids, attention_mask), num_layers
+                with METRICS.time("postprocess"):
+                    probabilities[bucket] = torch.sigmoid(outputs)
+                if exit_layers is not None:
+                    exit_layers[bucket] = depths
+        
+        return probabilities
+    
+    def embed_many(self, texts, batch_size=32):
+        """Pooled encoder embeddings ([N, hidden_size]) for texts, in input order"""
+        model = self.load_model()
+        encoded = self._encode(texts)
+        embeddings = torch.empty(len(encoded), model.bert.config.hidden_size)
+        
+        with inference_mode():
+            for bucket, input_ids, attention_mask in self._iter_padded(encoded, batch_size):
+                with METRICS.time("forward"):
+                    embeddings[bucket] = model.encode(input_ids, attention_mask)
+        return embeddings
+    
+    def score_corpus(self, corpus, batch_size=32, threshold=None):
+        """Score a PretokenizedCorpus batch by batch, with no tokenization
+        
+        Yields (indices, probabilities) per batch, where indices are the
+        positions of the batch's sequences in the corpus. With early_exit_path
+        set, texts only exit early when threshold is given and matches the
+        calibration (see _allow_exit); otherwise every text runs the full model.
+        """
+        meta = corpus.meta
+        if meta["tokenizer"] != self.tokenizer_name or meta["vocab_size"] != len(self.tokenizer):
+            raise ValueError(
+                f"Corpus was tokenized with {meta['tokenizer']} ({meta['vocab_size']} tokens), "
+                f"predictor uses {self.tokenizer_name} ({len(self.tokenizer)} tokens)"
+            )
+        if meta["max_length"] > self.max_length:
+            raise ValueError(
+                f"Corpus max_length {meta['max_length']} exceeds predictor max_length {self.max_length}"
+            )
+        
+        engine = self.get_engine()
+        allow_exit = threshold is not None and self._allow_exit(threshold)
+        with inference_mode():
+            for indices, input_ids, attention_mask in corpus.iter_batches(batch_size=batch_size):
+                if engine.name == "early_exit":
+                    outputs = engine.run(input_ids, attention_mask, allow_exit=allow_exit)[0]
+                else:
+                    outputs = engine(input_ids, attention_mask)
+                yield indices, torch.sigmoid(outputs)
+    
+    def _decode(self, probabilities, threshold, labels=None, top_k=None, fallback=None,
+                min_confidence=None, compact=False):
+        """Convert a batch of probabilities into per-text intent lists
+        
+        threshold is a float, a per-label sequence or tensor, or a
+        {label: threshold} dict. See decoding.decode_batch for top_k,
+        fallback and min_confidence. With compact, the DecodedBatch of NumPy
+        arrays is returned instead of lists of dicts.
+        """
+        with METRICS.time("postprocess"):
+            decoded = decode_batch(
+                probabilities,
+                labels or self.intent_labels,
+                thresholds=threshold,
+                top_k=top_k,
+                fallback=fallback,
+                min_confidence=min_confidence
+            )
+        if compact:
+            return decoded
+        
+        with METRICS.time("decode"):
+            return decoded.to_lists()
+    
+    def _cache_key(self, text):
+        return normalize_text(text, lowercase=getattr(self.tokenizer, 'do_lower_case', False))
+    
+    def _semantic_lookup(self, texts, missing, probabilities):
+        """Fill near-duplicate hits for the missing keys into probabilities
+        
+        Returns {key: embedding} of the texts still to score and
+        {key: cached probabilities} of the hits sampled for an audit.
+        """
+        keys = list(missing)
+        vectors = self.semantic_cache.embed(texts[missing[key][0]] for key in keys)
+        unscored, hit_keys = {}, []
+        for key, vector, cached in zip(keys, vectors, self.semantic_cache.lookup(vectors)):
+            if cached is None:
+                unscored[key] = vector
+            else:
+                probabilities[missing[key]] = cached
+                hit_keys.append(key)
+        
+        METRICS.inc("multi_intent_semantic_cache_hits_total", sum(len(missing[key]) for key in hit_keys),
+                    help_text="Texts answered from a cached near-duplicate")
+        audited = {
+            key: probabilities[missing[key][0]].clone()
+            for key in self.semantic_cache.sample_audit(hit_keys)
         }
+        return unscored, audited
+    
+    def _allow_exit(self, threshold, top_k=None, min_confidence=None):
+        """Whether texts decoded with these options may exit early
+        
+        Exit margins are calibrated at one threshold, so other thresholds,
+        top_k (which ranks exact probabilities) and min_confidence run every
+        layer, with a warning.
+        """
+        if self.early_exit_path is None:
+            return True
+        calibrated = self.get_engine().heads.threshold
+        thresholds = threshold_vector(threshold, self.intent_labels)
+        if top_k is None and min_confidence is None and np.allclose(thresholds, calibrated):
+            return True
+        warnings.warn(
+            f"Exit heads are calibrated for threshold {calibrated} without top_k or "
+            f"min_confidence; running every layer for this call"
+        )
+        return False
+    
+    def _probabilities(self, texts, batch_size=32, allow_exit=True):
+        """Sigmoid outputs for texts in input order, served from the caches where possible"""
+        # Early-exit rows are only valid at the calibrated threshold: keep them apart
+        early = allow_exit and self.early_exit_path is not None
+        suffix = "\x00exit" if early else ""
+        # The semantic cache holds early-exit rows when exits are on, so full-depth calls skip it
+        semantic_cache = self.semantic_cache if early or self.early_exit_path is None else None
+        if self.cache is None and semantic_cache is None:
+            return self._score_encoded(self._encode(texts), batch_size=batch_size, allow_exit=allow_exit)
+        
+        probabilities = torch.empty(len(texts), self.num_intents)
+        missing = {}
+        for i, text in enumerate(texts):
+            key = self._cache_key(text) + suffix
+            cached = self.cache.get(key) if self.cache is not None else None
+            if cached is not None:
+                probabilities[i] = cached
+            else:
+                missing.setdefault(key, []).append(i)
+        
+        if self.cache is not None:
+            METRICS.inc("multi_intent_cache_hits_total", len(texts) - sum(map(len, missing.values())),
+                        help_text="Texts answered from the probability cache")
+            METRICS.inc("multi_intent_cache_misses_total", len(missing),
+                        help_text="Distinct texts sent to the model after a cache miss")
+        
+        unscored, audited = {}, {}
+        if missing and semantic_cache is not None:
+            unscored, audited = self._semantic_lookup(texts, missing, probabilities)
+            # Audited hits are scored with the misses and served the full result
+            to_score = [*unscored, *audited]
+        else:
+            to_score = list(missing)
+        
+        if to_score:
+            scored = self._score_encoded(
+                self._encode(texts[missing[key][0]] for key in to_score),
+                batch_size=batch_size,
+                allow_exit=allow_exit
+            )
+            for key, row_probabilities in zip(to_score, scored):
+                if self.cache is not None:
+                    self.cache.put(key, row_probabilities.clone())
+                probabilities[missing[key]] = row_probabilities
+            if unscored:
+                semantic_cache.add(np.stack(list(unscored.values())), scored[:len(unscored)])
+            if audited:
+                semantic_cache.record_audit(torch.stack(list(audited.values())), scored[len(unscored):])
+        
+        return probabilities
+    
+    def _probability_dict(self, row, labels=None):
+        labels = labels or self.intent_labels
+        return {labels[i]: score for i, score in enumerate(row)}
+    
+    def analyze_many(self, texts, threshold=0.5, batch_size=32, top_k=None, fallback=None,
+                     min_confidence=None):
+        """Run the model once per text and return PredictionResult objects
+        
+        Each result carries both the thresholded intents and the full
+        probability vector, in the same order as the input.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        
+        probabilities = self._probabilities(texts, batch_size=batch_size,
+                                            allow_exit=self._allow_exit(threshold, top_k, min_confidence))
+        intents = self._decode(probabilities, threshold, top_k=top_k, fallback=fallback,
+                               min_confidence=min_confidence)
+        return [
+            PredictionResult(text, text_intents, self._probability_dict(row))
+            for text, text_intents, row in zip(texts, intents, probabilities.tolist())
+        ]
+    
+    def analyze_with_exit_layers(self, texts, threshold=0.5, batch_size=32):
+        """Like analyze_many, bypassing the cache, with each result's exit_layer set
+        
+        exit_layer is the number of encoder layers the text went through:
+        the full depth unless early_exit_path is set and it exited early.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        
+        exit_layers = torch.empty(len(texts), dtype=torch.long)
+        probabilities = self._score_encoded(self._encode(texts), batch_size=batch_size,
+                                            exit_layers=exit_layers,
+                                            allow_exit=self._allow_exit(threshold))
+        intents = self._decode(probabilities, threshold)
+        return [
+            PredictionResult(text, text_intents, self._probability_dict(row), exit_layer=depth)
+            for text, text_intents, row, depth
+            in zip(texts, intents, probabilities.tolist(), exit_layers.tolist())
+        ]
+    
+    def long_probabilities(self, texts, batch_size=32, stride=None, reduction="max", allow_exit=False):
+        """Per-text probabilities over every max_length window of each text
+        
+        Windows of all texts are scored together, so windows of different
+        texts share batches. Window probabilities are combined per text with
+        reduction: "max" (an intent stated anywhere counts) or "mean".
+        Windows only exit early with allow_exit (see _allow_exit).
+        """
+        if reduction not in WINDOW_REDUCTIONS:
+            raise ValueError(
+                f"Unknown reduction '{reduction}', expected one of: {', '.join(WINDOW_REDUCTIONS)}"
+            )
+        texts = list(texts)
+        if not texts:
+            return torch.empty(0, self.num_intents)
+        
+        windows, counts = self._encode_windows(texts, stride=stride)
+        window_probabilities = self._score_encoded(windows, batch_size=batch_size, allow_exit=allow_exit)
+        
+        reduce = WINDOW_REDUCTIONS[reduction]
+        with METRICS.time("postprocess"):
+            return torch.stack([reduce(rows) for rows in torch.split(window_probabilities, counts)])
+    
+    def analyze_long(self, texts, threshold=0.5, batch_size=32, stride=None, reduction="max"):
+        """Like analyze_many, but without truncation: long texts are scored in overlapping windows
+        
+        The result is still one intent set per text. The probability cache
+        is not used, since cached entries come from truncated inputs.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        
+        # An early exit keeps each window's decision, which max preserves and mean does not
+        allow_exit = reduction == "max" and self._allow_exit(threshold)
+        probabilities = self.long_probabilities(texts, batch_size=batch_size, stride=stride,
+                                                reduction=reduction, allow_exit=allow_exit)
+        intents = self._decode(probabilities, threshold)
+        return [
+            PredictionResult(text, text_intents, self._probability_dict(row))
+            for text, text_intents, row in zip(texts, intents, probabilities.tolist())
+        ]
+    
+    def predict_long(self, text, threshold=0.5, stride=None, reduction="max"):
+        """Predict intents for one text of any length"""
+        return self.analyze_long([text], threshold=threshold, stride=stride,
+                                 reduction=reduction)[0].intents
+    
+    def analyze(self, text, threshold=0.5):
+        """Intents and probabilities for one text from a single forward pass"""
+        return self.analyze_many([text], threshold=threshold)[0]
+    
+    def predict_many(self, texts, threshold=0.5, batch_size=32, top_k=None, fallback=None,
+                     min_confidence=None, compact=False):
+        """Predict intents for a list or iterable of texts in batches
+        
+        Returns one result list per text, in the same order as the input,
+        or with compact a decoding.DecodedBatch of label indices and scores.
+        threshold may be a float, a per-intent sequence or a {intent: threshold}
+        dict; top_k caps the intents per text; fallback (e.g. "other") is
+        returned for texts with no intent above threshold or with a top
+        probability below min_confidence.
+        """
+        texts = list(texts)
+        if not texts and not compact:
+            return []
+        
+        probabilities = (
+            self._probabilities(texts, batch_size=batch_size,
+                                allow_exit=self._allow_exit(threshold, top_k, min_confidence)) if texts
+            else torch.empty(0, self.num_intents)
+        )
+        return self._decode(probabilities, threshold, top_k=top_k, fallback=fallback,
+                            min_confidence=min_confidence, compact=compact)
+    
+    def predict(self, text, threshold=0.5, top_k=None, fallback=None, min_confidence=None):
+        """Predict intents for given text"""
+        return self.predict_many([text], threshold=threshold, top_k=top_k, fallback=fallback,
+                                 min_confidence=min_confidence)[0]
+    
+    def predict_proba(self, text):
+        """Get probability scores for all intents"""
+        probabilities = self._probabilities([text])
+        return self._probability_dict(probabilities[0].tolist())
+    
+    def cache_stats(self):
+        """Hit/miss counters of the probability cache"""
+        return self.cache.stats() if self.cache is not None else None
 
 # Example usage
 if __name__ == "__main__":
@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Asyncio micro-batching inference server for the Multi-Intent NLP Model
+
+Concurrent requests are queued and combined into one forward pass: a batch
+is flushed when it reaches max_batch_size or when its oldest request has
+waited max_wait_ms. The model runs in a single-thread executor so the event
+loop never blocks, and a bounded queue rejects requests with 503 when full
+(413 for a request with more texts than the whole queue holds).
+
+Endpoints (HTTP/1.1, JSON, standard library only):
+    POST /predict   {"text": "..."} or {"texts": ["...", ...]}
+    GET  /health
+    GET  /stats
+    GET  /metrics   Prometheus text format (see metrics.py)
+"""
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from metrics import METRICS, enable_metrics
+
+
+class QueueFullError(Exception):
+    """Raised when the request queue is at capacity"""
+
+
+class TooManyTextsError(Exception):
+    """Raised when one request has more texts than the queue can ever hold"""
+
+
+class MicroBatcher:
+    """Collects single-text requests into batches for MultiIntentPredictor.analyze_many"""
+
+    def __init__(self, predictor, max_batch_size=32, max_wait_ms=5.0, max_queue_size=1024,
+                 threshold=0.5):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self.threshold = threshold
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._worker = None
+        self.stats = {
+            'requests': 0,
+            'rejected': 0,
+            'batches': 0,
+            'batched_texts': 0,
+            'errors': 0
+        }
+
+    async def start(self):
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        loop = asyncio.get_running_loop()
+        # Load the model (and warm up its engine) before accepting traffic
+        await loop.run_in_executor(self.executor, self.predictor.get_engine)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    def free_slots(self):
+        return self.max_queue_size - self.queue.qsize()
+
+    def submit_nowait(self, text):
+        """Queue one text and return a future for its PredictionResult"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            raise QueueFullError("Request queue is full")
+        self.stats['requests'] += 1
+        return future
+
+    async def submit(self, text):
+        return await self.submit_nowait(text)
+
+    async def submit_many(self, texts):
+        """Queue all texts or none of them"""
+        if len(texts) > self.max_queue_size:
+            # Would never fit, so retrying cannot help
+            raise TooManyTextsError(
+                f"Request has {len(texts)} texts, the limit is {self.max_queue_size}"
+            )
+        if len(texts) > self.free_slots():
+            self.stats['rejected'] += len(texts)
+            raise QueueFullError("Request queue is full")
+        return await asyncio.gather(*[self.submit_nowait(text) for text in texts])
+
+    async def _collect(self):
+        """Wait for one request, then gather more until the batch is full or the wait expires"""
+        batch = [await self.queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Skip requests whose callers have already gone away
+            batch = [(text, future) for text, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor,
+                    self.predictor.analyze_many,
+                    texts,
+                    self.threshold,
+                    len(texts)
+                )
+            except Exception as e:
+                self.stats['errors'] += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.stats['batches'] += 1
+            self.stats['batched_texts'] += len(texts)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['queue_size'] = self.queue.qsize() if self.queue is not None else 0
+        stats['mean_batch_size'] = (
+            stats['batched_texts'] / stats['batches'] if stats['batches'] else 0.0
+        )
+        semantic_cache = getattr(self.predictor, 'semantic_cache', None)
+        if semantic_cache is not None:
+            stats['semantic_cache'] = semantic_cache.stats()
+        return stats
+
+
+class InferenceServer:
+    """Minimal HTTP/1.1 JSON front end for a MicroBatcher"""
+
+    def __init__(self, batcher, host="127.0.0.1", port=8000, max_body_bytes=1024 * 1024):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.max_body_bytes = max_body_bytes
+        self.server = None
+        self._connections = set()
+
+    async def start(self):
+        await self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            # Idle keep-alive connections would otherwise hold wait_closed open
+            for writer in list(self._connections):
+                writer.close()
+            await self.server.wait_closed()
+        await self.batcher.stop()
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def _handle_connection(self, reader, writer):
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line'})
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    length = int(headers.get("content-length", 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST,
+                                        {'error': 'Invalid Content-Length'}, keep_alive=False)
+                    break
+                if length > self.max_body_bytes:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                        {'error': 'Request body too large'}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, payload, extra_headers = await self._dispatch(method, path, body)
+                keep_alive = (
+                    version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                )
+                await self._respond(writer, status, payload, extra_headers, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {'status': 'ok'}, None
+        if method == "GET" and path == "/stats":
+            return HTTPStatus.OK, self.batcher.snapshot(), None
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, METRICS.render_prometheus(), None
+        if path != "/predict":
+            return HTTPStatus.NOT_FOUND, {'error': f'Unknown path {path}'}, None
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Use POST'}, None
+
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError:
+            return HTTPStatus.BAD_REQUEST, {'error': 'Body must be JSON'}, None
+
+        texts = request.get("texts") if isinstance(request, dict) else None
+        single = isinstance(request, dict) and isinstance(request.get("text"), str)
+        if single:
+            texts = [request["text"]]
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return HTTPStatus.BAD_REQUEST, {'error': 'Expected "text" or "texts"'}, None
+
+        started = time.perf_counter()
+        try:
+            results = await self.batcher.submit_many(texts)
+        except TooManyTextsError as e:
+            return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': str(e)}, None
+        except QueueFullError as e:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': str(e)}, {'Retry-After': '1'}
+        except Exception as e:
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}, None
+
+        outputs = [result.to_dict() for result in results]
+        payload = outputs[0] if single else {'results': outputs}
+        latency_ms = (time.perf_counter() - started) * 1000
+        return HTTPStatus.OK, payload, {'X-Latency-Ms': f'{latency_ms:.2f}'}
+
+    async def _respond(self, writer, status, payload, extra_headers=None, keep_alive=True):
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        lines = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"
+        ]
+        for name, value in (extra_headers or {}).items():
+            lines.append(f"{name}: {value}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def run_server(predictor, host="127.0.0.1", port=8000, max_batch_size=32, max_wait_ms=5.0,
+                     max_queue_size=1024, threshold=0.5):
+    batcher = MicroBatcher(
+        predictor,
+        max_batch_size=max_batch_size,
+        max_wait_ms=max_wait_ms,
+        max_queue_size=max_queue_size,
+        threshold=threshold
+    )
+    server = await InferenceServer(batcher, host=host, port=port).start()
+    print(f"🚀 Serving on http://{server.host}:{server.port} "
+          f"(batch ≤ {max_batch_size}, wait ≤ {max_wait_ms} ms, queue ≤ {max_queue_size})")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Micro-batching HTTP inference server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue-size", type=int, default=1024)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--metrics", action="store_true", help="Record stage timings for /metrics")
+    parser.add_argument("--semantic-cache", type=float, metavar="MIN_SIMILARITY",
+                        help="Answer near-duplicates of recent texts from a semantic cache")
+    parser.add_argument("--audit-rate", type=float, default=0.01,
+                        help="Share of semantic cache hits also scored in full for /stats")
+    args = parser.parse_args()
+
+    if args.metrics:
+        enable_metrics()
+
+    semantic_cache = None
+    if args.semantic_cache is not None:
+        from semantic_cache import SemanticCache
+        semantic_cache = SemanticCache(min_similarity=args.semantic_cache, audit_rate=args.audit_rate,
+                                       audit_threshold=args.threshold)
+
+    try:
+        asyncio.run(run_server(
+            MultiIntentPredictor(semantic_cache=semantic_cache),
+            host=args.host,
+            port=args.port,
+            max_batch_size=args.max_batch_size,
+            max_wait_ms=args.max_wait_ms,
+            max_queue_size=args.max_queue_size,
+            threshold=args.threshold
+        ))
+    except KeyboardInterrupt:
+        print("\n👋 Server stopped")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Low-overhead stage timing and metrics for the Multi-Intent NLP Model
+
+Stages of the prediction path (tokenize, forward, postprocess, decode) and
+of startup (reconstruct, model_load, engine_warmup) feed histograms;
+batch sizes and cache hits/misses feed histograms and counters. Metrics are
+off unless enabled (enable_metrics() or MULTI_INTENT_METRICS=1); when off,
+every hook returns immediately.
+
+    from metrics import METRICS, enable_metrics
+    enable_metrics()
+    ...
+    print(METRICS.render_prometheus())
+    print(METRICS.log_line())
+"""
+import os
+import json
+import time
+import bisect
+import threading
+from contextlib import nullcontext
+
+STAGE_HISTOGRAM = "multi_intent_stage_seconds"
+
+# Seconds: covers sub-millisecond postprocessing up to multi-minute reconstruction
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+_NULL_TIMER = nullcontext()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket containing it"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class _StageTimer:
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.registry.observe_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class MetricsRegistry:
+    """Named histogram and counter families with optional labels"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._families = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def _series(self, name, kind, labels, help_text, buckets=None):
+        key = tuple(sorted((labels or {}).items()))
+        family = self._families.get(name)
+        if family is None:
+            with self._lock:
+                family = self._families.setdefault(name, {
+                    'type': kind,
+                    'help': help_text,
+                    'series': {}
+                })
+        series = family['series'].get(key)
+        if series is None:
+            with self._lock:
+                series = family['series'].setdefault(
+                    key, Histogram(buckets) if kind == "histogram" else Counter()
+                )
+        return series
+
+    def time(self, stage):
+        """Context manager timing one stage; a shared no-op when metrics are off"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, stage)
+
+    def observe_stage(self, stage, seconds):
+        if not self.enabled:
+            return
+        self._series(STAGE_HISTOGRAM, "histogram", {'stage': stage},
+                     "Time spent per stage", TIME_BUCKETS).observe(seconds)
+        for listener in self._listeners:
+            listener(stage, seconds)
+
+    def observe(self, name, value, labels=None, buckets=SIZE_BUCKETS, help_text=""):
+        if not self.enabled:
+            return
+        self._series(name, "histogram", labels, help_text, buckets).observe(value)
+
+    def inc(self, name, amount=1, labels=None, help_text=""):
+        if not self.enabled:
+            return
+        self._series(name, "counter", labels, help_text).inc(amount)
+
+    def add_listener(self, listener):
+        """Call listener(stage, seconds) after every timed stage"""
+        self._listeners.append(listener)
+
+    def reset(self):
+        with self._lock:
+            self._families = {}
+
+    def render_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            if family['help']:
+                lines.append(f"# HELP {name} {family['help']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key, series in sorted(family['series'].items()):
+                labels = dict(key)
+                if family['type'] == "counter":
+                    lines.append(f"{name}{_format_labels(labels)} {series.value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(series.buckets + (float("inf"),), series.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(dict(labels, le=le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {series.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {series.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Compact dict of every series: counts, sums, means and estimated p50/p95/p99"""
+        summary = {}
+        for name, family in sorted(self._families.items()):
+            for key, series in sorted(family['series'].items()):
+                series_name = name + _format_labels(dict(key))
+                if family['type'] == "counter":
+                    summary[series_name] = series.value
+                else:
+                    summary[series_name] = {
+                        'count': series.count,
+                        'sum': series.sum,
+                        'mean': series.sum / series.count if series.count else 0.0,
+                        'p50': series.quantile(0.5),
+                        'p95': series.quantile(0.95),
+                        'p99': series.quantile(0.99)
+                    }
+        return summary
+
+    def log_line(self):
+        """One structured JSON log line with the current summary"""
+        return json.dumps({
+            'event': 'multi_intent_metrics',
+            'timestamp': time.time(),
+            'metrics': self.summary()
+        })
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{value}"' for key, value in sorted(labels.items()))
+    return "{" + inner + "}"
+
+
+METRICS = MetricsRegistry(enabled=os.environ.get("MULTI_INTENT_METRICS") == "1")
+
+
+def enable_metrics():
+    METRICS.enabled = True
+    return METRICS
+
+
+def disable_metrics():
+    METRICS.enabled = False
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Flat, memory-mapped weight format for the Multi-Intent NLP Model
+
+The checkpoint is converted once into a single file of raw tensor bytes
+with a JSON header. Loading maps the file read-only (copy-on-write), so
+worker processes share the weight pages through the OS page cache instead
+of each unpickling a private copy.
+
+Layout: MAGIC | header length (uint64, little endian) | JSON header |
+padding | tensor data, every tensor aligned to ALIGNMENT bytes.
+"""
+import os
+import json
+import struct
+import argparse
+
+import numpy as np
+import torch
+
+from model_architecture import build_model_from_state_dict, resolve_config
+
+MAGIC = b"MIFLAT01"
+ALIGNMENT = 64
+FLAT_MODEL_PATH = "multi_intent_model.flat"
+
+# torch dtype name -> (numpy dtype used for the raw bytes, torch dtype)
+DTYPES = {
+    "float32": (np.float32, torch.float32),
+    "float16": (np.float16, torch.float16),
+    "bfloat16": (np.int16, torch.bfloat16),
+    "int64": (np.int64, torch.int64),
+    "int32": (np.int32, torch.int32),
+    "uint8": (np.uint8, torch.uint8),
+    "bool": (np.bool_, torch.bool)
+}
+
+def _dtype_name(dtype):
+    return str(dtype).replace("torch.", "")
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def _tensor_bytes(tensor):
+    tensor = tensor.detach().cpu().contiguous()
+    if tensor.dtype == torch.bfloat16:
+        tensor = tensor.view(torch.int16)
+    return tensor.numpy().tobytes()
+
+def flat_layout(tensors):
+    """Header entries and data size for {name: (dtype name, shape)}, in order"""
+    entries = {}
+    offset = 0
+    for name, (dtype, shape) in tensors.items():
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported dtype {dtype} for {name}")
+        nbytes = int(np.prod(shape, dtype=np.int64)) * np.dtype(DTYPES[dtype][0]).itemsize
+        entries[name] = {
+            "dtype": dtype,
+            "shape": list(shape),
+            "offset": offset,
+            "nbytes": nbytes
+        }
+        offset = _align(offset + nbytes)
+    return entries, offset
+
+def write_flat_header(f, entries, metadata=None):
+    """Write magic and JSON header; returns the byte offset of the tensor data"""
+    header = json.dumps({
+        "version": 1,
+        "metadata": metadata or {},
+        "tensors": entries
+    }).encode("utf-8")
+    f.write(MAGIC)
+    f.write(struct.pack("<Q", len(header)))
+    f.write(header)
+    return _align(len(MAGIC) + 8 + len(header))
+
+def save_flat_weights(state_dict, output_path, metadata=None):
+    """Write a state dict in the flat format, one tensor at a time"""
+    entries, size = flat_layout({
+        name: (_dtype_name(tensor.dtype), tuple(tensor.shape)) for name, tensor in state_dict.items()
+    })
+
+    part_path = output_path + ".part"
+    with open(part_path, "wb") as f:
+        data_start = write_flat_header(f, entries, metadata)
+        for name, tensor in state_dict.items():
+            f.seek(data_start + entries[name]["offset"])
+            f.write(_tensor_bytes(tensor))
+        f.truncate(data_start + size)
+    os.replace(part_path, output_path)
+    return entries
+
+def read_flat_header(path):
+    """Return (header dict, byte offset of the tensor data)"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a flat weight file")
+        (header_length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+    return header, _align(len(MAGIC) + 8 + header_length)
+
+def load_flat_state_dict(path):
+    """Map a flat weight file and return (state dict of zero-copy tensors, metadata)"""
+    header, data_start = read_flat_header(path)
+    size = os.path.getsize(path) - data_start
+
+    # Copy-on-write mapping: pages stay shared with every other process
+    # mapping the same file unless a tensor is written to
+    data = np.memmap(path, dtype=np.uint8, mode="c", offset=data_start, shape=(size,))
+
+    state_dict = {}
+    for name, entry in header["tensors"].items():
+        np_dtype, torch_dtype = DTYPES[entry["dtype"]]
+        start = entry["offset"]
+        array = data[start:start + entry["nbytes"]].view(np_dtype).reshape(entry["shape"])
+        tensor = torch.from_numpy(array)
+        if tensor.dtype != torch_dtype:
+            tensor = tensor.view(torch_dtype)
+        state_dict[name] = tensor
+    return state_dict, header["metadata"]
+
+def read_checkpoint(path, config="bert-base-uncased"):
+    """(state dict, flat metadata) of a .pth checkpoint or a flat file
+
+    For a .pth checkpoint the encoder config is resolved and stored in the
+    metadata when possible, so the flat file alone is enough to rebuild the
+    model.
+    """
+    if path.endswith(".flat"):
+        return load_flat_state_dict(path)
+
+    from safe_model_loader import safe_torch_load
+
+    loaded = safe_torch_load(path)
+    state_dict = loaded.state_dict() if isinstance(loaded, torch.nn.Module) else loaded
+    metadata = {"num_intents": int(state_dict["classifier.weight"].shape[0])}
+    try:
+        metadata["config"] = resolve_config(config).to_dict()
+    except OSError as e:
+        print(f"⚠️ Encoder config not stored ({e}); pass config= when loading")
+    return state_dict, metadata
+
+def convert_checkpoint(checkpoint_path, output_path=FLAT_MODEL_PATH, config="bert-base-uncased"):
+    """One-time conversion of the reconstructed checkpoint into the flat format"""
+    state_dict, metadata = read_checkpoint(checkpoint_path, config)
+    save_flat_weights(state_dict, output_path, metadata=metadata)
+    size_mb = os.path.getsize(output_path) / (1024 * 1024)
+    print(f"✅ Wrote {len(state_dict)} tensors to {output_path} ({size_mb:.2f} MB)")
+    return output_path
+
+def load_mmap_model(path=FLAT_MODEL_PATH, num_intents=None, config=None):
+    """Build MultiIntentClassifier on top of memory-mapped weights"""
+    state_dict, metadata = load_flat_state_dict(path)
+    config = config or metadata.get("config") or "bert-base-uncased"
+    return build_model_from_state_dict(state_dict, num_intents=num_intents, config=config)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the checkpoint to the memory-mapped format")
+    parser.add_argument("checkpoint", nargs="?", default="multi_intent_model_reconstructed.pth")
+    parser.add_argument("output", nargs="?", default=FLAT_MODEL_PATH)
+    parser.add_argument("--config", default="bert-base-uncased",
+                        help="Encoder config name or local directory with config.json")
+    args = parser.parse_args()
+
+    convert_checkpoint(args.checkpoint, args.output, config=args.config)
@@ -1,30 +1,130 @@
+from contextlib import contextmanager
+
 import torch
 import torch.nn as nn
-from transformers import AutoModel, AutoTokenizer
+from transformers import AutoConfig, AutoModel, AutoTokenizer, PretrainedConfig
 
 class MultiIntentClassifier(nn.Module):
-    def __init__(self, num_intents, model_name="bert-base-uncased", dropout_prob=0.3):
+    def __init__(self, num_intents, model_name="bert-base-uncased", dropout_prob=0.3, config=None):
         super(MultiIntentClassifier, self).__init__()
-        self.bert = AutoModel.from_pretrained(model_name)
+        if config is not None:
+            # Architecture only: no pretrained weights are downloaded or read
+            self.bert = AutoModel.from_config(resolve_config(config))
+        else:
+            self.bert = AutoModel.from_pretrained(model_name)
         self.dropout = nn.Dropout(dropout_prob)
         self.classifier = nn.Linear(self.bert.config.hidden_size, num_intents)
         
     def forward(self, input_ids, attention_mask):
-        outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
-        pooled_output = outputs.pooler_output
+        pooled_output = self.encode(input_ids, attention_mask)
         output = self.dropout(pooled_output)
         logits = self.classifier(output)
         return logits
+    
+    def encode(self, input_ids, attention_mask):
+        """Pooled [CLS] embedding that the classifier head reads"""
+        outputs = self.bert(input_ids=input_ids, attention_mask=attention_mask)
+        return outputs.pooler_output
 
-def load_model_with_architecture(model_path, num_intents=10):
+def assign_state_dict(model, state_dict, strict=True):
     """
-    Load the model with the correct architecture
+    Load weights by reference instead of copying them into the existing parameters,
+    so tensors backed by shared or memory-mapped storage stay shared
+    """
+    expected = set(model.state_dict().keys())
+    unexpected = [name for name in state_dict if name not in expected]
+    missing = [name for name in expected if name not in state_dict]
+    if strict and (missing or unexpected):
+        raise RuntimeError(
+            f"Error assigning state_dict: missing keys {missing}, unexpected keys {unexpected}"
+        )
+    
+    for name, tensor in state_dict.items():
+        if name not in expected:
+            continue
+        module_name, _, leaf = name.rpartition(".")
+        module = model.get_submodule(module_name) if module_name else model
+        if leaf in module._parameters:
+            module._parameters[leaf] = nn.Parameter(tensor, requires_grad=False)
+        else:
+            module._buffers[leaf] = tensor
+    return model
+
+def match_state_dict_shapes(model):
+    """
+    Update size attributes after tensors of other shapes were assigned, e.g.
+    from a checkpoint with pruned attention heads or FFN neurons
+    """
+    for module in model.modules():
+        if isinstance(module, nn.Linear):
+            module.out_features, module.in_features = module.weight.shape
+    for module in model.modules():
+        if hasattr(module, "attention_head_size") and hasattr(module, "query"):
+            module.num_attention_heads = module.query.out_features // module.attention_head_size
+            module.all_head_size = module.query.out_features
+    return model
+
+def resolve_config(config):
     """
-    model = MultiIntentClassifier(num_intents=num_intents)
-    model.load_state_dict(torch.load(model_path, map_location='cpu'))
+    Accept a transformers config object, a config dict, or a model name /
+    local directory containing config.json
+    """
+    if isinstance(config, PretrainedConfig):
+        return config
+    if isinstance(config, dict):
+        config = dict(config)
+        model_type = config.pop("model_type", "bert")
+        return AutoConfig.for_model(model_type, **config)
+    return AutoConfig.from_pretrained(config)
+
+@contextmanager
+def init_empty_weights():
+    """
+    Create module parameters on the meta device, so building a model allocates
+    and initializes no weight memory. Buffers are left on the CPU.
+    """
+    original_register = nn.Module.register_parameter
+    
+    def register_empty_parameter(module, name, param):
+        original_register(module, name, param)
+        if param is not None:
+            module._parameters[name] = nn.Parameter(
+                module._parameters[name].to("meta"),
+                requires_grad=param.requires_grad
+            )
+    
+    nn.Module.register_parameter = register_empty_parameter
+    try:
+        yield
+    finally:
+        nn.Module.register_parameter = original_register
+
+def build_model_from_state_dict(state_dict, num_intents=None, config="bert-base-uncased"):
+    """
+    Build MultiIntentClassifier from a config with empty parameters and fill
+    them with the checkpoint tensors, without loading pretrained weights first
+    """
+    if num_intents is None:
+        num_intents = state_dict["classifier.weight"].shape[0]
+    
+    with init_empty_weights():
+        model = MultiIntentClassifier(num_intents=num_intents, config=config)
+    assign_state_dict(model, state_dict)
+    # Pruned checkpoints have fewer heads / FFN neurons than the config says
+    match_state_dict_shapes(model)
     model.eval()
     return model
 
+def load_model_with_architecture(model_path, num_intents=10, config="bert-base-uncased"):
+    """
+    Load the model with the correct architecture
+    
+    config may be a local directory with config.json, so the model can be
+    built on nodes that only have the config and the checkpoint.
+    """
+    state_dict = torch.load(model_path, map_location='cpu')
+    return build_model_from_state_dict(state_dict, num_intents=num_intents, config=config)
+
 # Example usage
 if __name__ == "__main__":
     # This should be used with the reconstructed model
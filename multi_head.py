@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Several named classifier heads over one shared encoder
+
+Each head has its own label set and thresholds. The encoder runs once per
+batch and every head reads the same pooled output, so serving N label sets
+costs one BERT plus N small Linear layers. Heads can be registered,
+replaced and removed while requests are being served; the encoder is
+never reloaded.
+
+    predictor = MultiIntentPredictor()
+    heads = MultiHeadPredictor(predictor)           # "default": the model's own head
+    heads.load_head("billing", "heads/billing.pt")  # written by embedding_store.save_head
+    results = heads.analyze_many(["Refund my last invoice"])
+    results[0]["billing"].intents
+"""
+import threading
+
+import torch
+
+from inference_engines import inference_mode
+from metrics import METRICS
+
+DEFAULT_HEAD = "default"
+
+
+class IntentHead:
+    """A classifier over pooled embeddings with its labels and per-label thresholds"""
+
+    def __init__(self, name, classifier, labels, thresholds=0.5):
+        if classifier.out_features != len(labels):
+            raise ValueError(
+                f"Head '{name}' has {classifier.out_features} outputs but {len(labels)} labels"
+            )
+        if isinstance(thresholds, (int, float)):
+            thresholds = [float(thresholds)] * len(labels)
+        if len(thresholds) != len(labels):
+            raise ValueError(f"Head '{name}' has {len(labels)} labels but {len(thresholds)} thresholds")
+        self.name = name
+        self.classifier = classifier.eval()
+        self.labels = list(labels)
+        self.thresholds = torch.tensor(thresholds, dtype=torch.float32)
+
+    def __repr__(self):
+        return f"IntentHead(name={self.name!r}, labels={len(self.labels)})"
+
+
+class MultiHeadPredictor:
+    """Applies every registered head to the shared encoder output of a MultiIntentPredictor"""
+
+    def __init__(self, predictor, include_default=True):
+        self.predictor = predictor
+        self._lock = threading.Lock()
+        self._heads = {}
+        if include_default:
+            model = predictor.load_model()
+            self.register_head(DEFAULT_HEAD, model.classifier, predictor.intent_labels)
+
+    @property
+    def heads(self):
+        return dict(self._heads)
+
+    def register_head(self, name, classifier, labels, thresholds=0.5):
+        """Add or replace a head; requests already running keep the heads they started with"""
+        head = IntentHead(name, classifier, labels, thresholds)
+        hidden_size = self.predictor.load_model().bert.config.hidden_size
+        in_features = getattr(classifier, "in_features", hidden_size)
+        if in_features != hidden_size:
+            raise ValueError(
+                f"Head '{name}' expects {in_features}-d input, the encoder produces {hidden_size}-d"
+            )
+        with self._lock:
+            heads = dict(self._heads)
+            heads[name] = head
+            self._heads = heads
+        return head
+
+    def load_head(self, name, path, labels=None, thresholds=None):
+        """Register a head saved by embedding_store.save_head
+
+        labels and thresholds override the ones stored in the file; labels
+        default to the predictor's intents when the file has none.
+        """
+        from embedding_store import read_head
+
+        classifier, stored_labels, stored_thresholds = read_head(path)
+        return self.register_head(
+            name,
+            classifier,
+            labels or stored_labels or self.predictor.intent_labels,
+            thresholds if thresholds is not None else (stored_thresholds or 0.5)
+        )
+
+    def remove_head(self, name):
+        with self._lock:
+            heads = dict(self._heads)
+            del heads[name]
+            self._heads = heads
+
+    def _select(self, heads):
+        registry = self._heads
+        return [registry[name] for name in heads] if heads is not None else list(registry.values())
+
+    def _score(self, texts, selected, batch_size):
+        embeddings = self.predictor.embed_many(texts, batch_size=batch_size)
+        with inference_mode(), METRICS.time("postprocess"):
+            return [torch.sigmoid(head.classifier(embeddings)) for head in selected]
+
+    def probabilities(self, texts, heads=None, batch_size=32):
+        """{head name: [N, num_labels] probabilities}, running the encoder once per batch"""
+        selected = self._select(heads)
+        scores = self._score(list(texts), selected, batch_size)
+        return {head.name: probabilities for head, probabilities in zip(selected, scores)}
+
+    def analyze_many(self, texts, heads=None, batch_size=32):
+        """One {head name: PredictionResult} dict per text, in input order
+
+        heads limits the output to the named heads (default: all of them).
+        """
+        from inference_example import PredictionResult
+
+        texts = list(texts)
+        if not texts:
+            return []
+
+        selected = self._select(heads)
+        results = [{} for _ in texts]
+        for head, probabilities in zip(selected, self._score(texts, selected, batch_size)):
+            intents = self.predictor._decode(probabilities, head.thresholds, labels=head.labels)
+            for result, text, text_intents, row in zip(results, texts, intents, probabilities.tolist()):
+                result[head.name] = PredictionResult(
+                    text, text_intents, self.predictor._probability_dict(row, labels=head.labels)
+                )
+        return results
+
+    def predict(self, text, heads=None):
+        """{head name: intent list} for one text"""
+        return {name: result.intents for name, result in self.analyze_many([text], heads)[0].items()}
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Half-precision, compressed chunk packaging of the Multi-Intent NLP Model
+
+The raw chunks are the fp32 pickle split into pieces. A packed release
+stores floating-point tensors as fp16 or bf16 in the flat layout of
+mmap_weights.py, cuts the tensor data into chunk_size pieces and
+compresses each one with a stdlib codec (zlib, bz2 or lzma) after a byte
+shuffle that groups the low and high bytes of the 16-bit values. The
+flat header and the chunk list go into packed_manifest.json.
+
+Reconstruction fetches the chunks in parallel; every worker verifies,
+decompresses and upcasts its own chunk straight into a preallocated fp32
+flat file (the codecs release the GIL, so this scales with threads). The
+result is loaded like any other flat file:
+
+    python packed_chunks.py pack multi_intent_model_reconstructed.pth packed/ --dtype float16
+    python packed_chunks.py reconstruct --base-url packed/ --output multi_intent_model.flat
+    predictor = MultiIntentPredictor(weights_path="multi_intent_model.flat")
+"""
+import os
+import bz2
+import json
+import lzma
+import time
+import zlib
+import bisect
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import torch
+
+from mmap_weights import (
+    FLAT_MODEL_PATH, ALIGNMENT, DTYPES, _dtype_name, _tensor_bytes,
+    flat_layout, write_flat_header, read_checkpoint
+)
+from reconstruct_from_github import (
+    DEFAULT_WORKERS, get_base_url, create_session, iter_location, join_location
+)
+from metrics import METRICS
+
+PACKED_MANIFEST_NAME = "packed_manifest.json"
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+PACKED_DTYPES = ("float16", "bfloat16")
+
+# name -> (compress(data, level), decompress(data), default level)
+CODECS = {
+    "zlib": (lambda data, level: zlib.compress(data, level), zlib.decompress, 6),
+    "bz2": (lambda data, level: bz2.compress(data, level), bz2.decompress, 9),
+    "lzma": (lambda data, level: lzma.compress(data, preset=level), lzma.decompress, 6)
+}
+
+
+def packed_chunk_filename(chunk_number, codec):
+    return f"packed_chunk_{chunk_number:03d}.{codec}"
+
+
+def _shuffle(data):
+    """Bytes 0 of every 16-bit value, then bytes 1 (exponents compress well on their own)"""
+    return np.frombuffer(data, dtype=np.uint8).reshape(-1, 2).T.tobytes()
+
+
+def _unshuffle(data):
+    return np.frombuffer(data, dtype=np.uint8).reshape(2, -1).T.tobytes()
+
+
+def pack_model(checkpoint_path, output_dir, dtype="float16", codec="zlib", level=None,
+               chunk_size=DEFAULT_CHUNK_SIZE, config="bert-base-uncased", workers=DEFAULT_WORKERS):
+    """Write half-precision compressed chunks and packed_manifest.json into output_dir
+
+    Floating-point tensors are stored as dtype and restored to their
+    original dtype on reconstruction; other tensors are stored unchanged.
+    """
+    if dtype not in PACKED_DTYPES:
+        raise ValueError(f"dtype must be one of {', '.join(PACKED_DTYPES)}")
+    if codec not in CODECS:
+        raise ValueError(f"codec must be one of {', '.join(CODECS)}")
+    if chunk_size % ALIGNMENT:
+        raise ValueError(f"chunk_size must be a multiple of {ALIGNMENT}")
+    compress, _, default_level = CODECS[codec]
+    level = default_level if level is None else level
+    packed_dtype = getattr(torch, dtype)
+
+    state_dict, metadata = read_checkpoint(checkpoint_path, config)
+    packed = {
+        name: tensor.to(packed_dtype) if tensor.is_floating_point() else tensor
+        for name, tensor in state_dict.items()
+    }
+    entries, data_size = flat_layout({
+        name: (_dtype_name(tensor.dtype), tuple(tensor.shape)) for name, tensor in packed.items()
+    })
+    data = bytearray(data_size)
+    for name, tensor in packed.items():
+        start = entries[name]["offset"]
+        data[start:start + entries[name]["nbytes"]] = _tensor_bytes(tensor)
+    del packed
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    def write_chunk(number):
+        offset = (number - 1) * chunk_size
+        raw = bytes(data[offset:offset + chunk_size])
+        blob = compress(_shuffle(raw), level)
+        name = packed_chunk_filename(number, codec)
+        with open(os.path.join(output_dir, name), "wb") as f:
+            f.write(blob)
+        return {
+            "name": name,
+            "offset": offset,
+            "size": len(raw),
+            "compressed_size": len(blob),
+            "sha256": hashlib.sha256(blob).hexdigest()
+        }
+
+    num_chunks = (data_size + chunk_size - 1) // chunk_size
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        chunks = list(pool.map(write_chunk, range(1, num_chunks + 1)))
+
+    manifest = {
+        "version": 1,
+        "codec": codec,
+        "packed_dtype": dtype,
+        "shuffle": True,
+        "data_size": data_size,
+        "source_dtypes": {name: _dtype_name(tensor.dtype) for name, tensor in state_dict.items()},
+        "tensors": entries,
+        "metadata": metadata,
+        "chunks": chunks
+    }
+    with open(os.path.join(output_dir, PACKED_MANIFEST_NAME), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    full_size = sum(tensor.numel() * tensor.element_size() for tensor in state_dict.values())
+    packed_size = sum(chunk["compressed_size"] for chunk in chunks)
+    print(f"✅ Packed {len(entries)} tensors into {len(chunks)} {codec} chunks in {output_dir}")
+    print(f"📊 {full_size / (1024 * 1024):.2f} MB of tensors -> {packed_size / (1024 * 1024):.2f} MB "
+          f"({packed_size / full_size:.1%})")
+    return manifest
+
+
+class _Upcaster:
+    """Writes decompressed byte ranges of the packed data into the output flat file"""
+
+    def __init__(self, manifest, output_entries, output_path, data_start):
+        packed = manifest["tensors"]
+        self.names = sorted(packed, key=lambda name: packed[name]["offset"])
+        self.starts = [packed[name]["offset"] for name in self.names]
+        self.packed = packed
+        self.output = output_entries
+        self.output_path = output_path
+        self.data_start = data_start
+
+    def write(self, offset, raw):
+        """Upcast raw (packed data bytes starting at offset) into the output file"""
+        end = offset + len(raw)
+        first = max(bisect.bisect_right(self.starts, offset) - 1, 0)
+        with open(self.output_path, "r+b") as f:
+            for name in self.names[first:]:
+                entry = self.packed[name]
+                if entry["offset"] >= end:
+                    break
+                start = max(entry["offset"], offset)
+                stop = min(entry["offset"] + entry["nbytes"], end)
+                if start >= stop:
+                    continue
+                piece = raw[start - offset:stop - offset]
+                target = self.output[name]
+                if target["dtype"] != entry["dtype"]:
+                    values = torch.frombuffer(bytearray(piece), dtype=DTYPES[entry["dtype"]][1])
+                    piece = _tensor_bytes(values.to(DTYPES[target["dtype"]][1]))
+                # Same element index, wider elements
+                index = (start - entry["offset"]) // np.dtype(DTYPES[entry["dtype"]][0]).itemsize
+                f.seek(self.data_start + target["offset"] + index * np.dtype(DTYPES[target["dtype"]][0]).itemsize)
+                f.write(piece)
+
+
+def reconstruct_packed(base_url=None, output_path=FLAT_MODEL_PATH, workers=DEFAULT_WORKERS):
+    """Fetch, decompress and upcast packed chunks into an fp32 flat file
+
+    Returns True on success. Each chunk's compressed bytes are checked
+    against the manifest before they are decoded.
+    """
+    with METRICS.time("reconstruct"):
+        return _reconstruct_packed(get_base_url(base_url), output_path, workers)
+
+
+def _reconstruct_packed(base_url, output_path, workers):
+    print(f"🔧 Reconstructing packed model from {base_url} ({workers} workers)...")
+    session = create_session(workers)
+    part_path = output_path + ".part"
+    started = time.perf_counter()
+
+    try:
+        manifest = json.loads(b"".join(iter_location(join_location(base_url, PACKED_MANIFEST_NAME), session)))
+        _, decompress, _ = CODECS[manifest["codec"]]
+        output_entries, output_size = flat_layout({
+            name: (manifest["source_dtypes"][name], tuple(entry["shape"]))
+            for name, entry in manifest["tensors"].items()
+        })
+        with open(part_path, "wb") as f:
+            data_start = write_flat_header(f, output_entries, manifest["metadata"])
+            f.truncate(data_start + output_size)
+        upcaster = _Upcaster(manifest, output_entries, part_path, data_start)
+
+        def fetch(chunk):
+            blob = b"".join(iter_location(join_location(base_url, chunk["name"]), session))
+            if hashlib.sha256(blob).hexdigest() != chunk["sha256"]:
+                raise RuntimeError(f"Checksum mismatch for {chunk['name']}")
+            raw = decompress(blob)
+            if manifest["shuffle"]:
+                raw = _unshuffle(raw)
+            if len(raw) != chunk["size"]:
+                raise RuntimeError(f"{chunk['name']}: expected {chunk['size']} bytes, got {len(raw)}")
+            upcaster.write(chunk["offset"], raw)
+            METRICS.inc("multi_intent_chunks_downloaded_total",
+                        help_text="Model chunks fetched during reconstruction")
+            METRICS.inc("multi_intent_chunk_bytes_downloaded_total", len(blob),
+                        help_text="Bytes fetched during reconstruction")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch, chunk) for chunk in manifest["chunks"]]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    except Exception as e:
+        print(f"❌ Failed to reconstruct packed model: {e}")
+        return False
+    finally:
+        session.close()
+
+    os.replace(part_path, output_path)
+    elapsed = time.perf_counter() - started
+    downloaded = sum(chunk["compressed_size"] for chunk in manifest["chunks"]) / (1024 * 1024)
+    saved = output_size / (1024 * 1024) - downloaded
+    print(f"🎉 Packed model reconstructed to {output_path} in {elapsed:.2f}s")
+    # Decoding pays for itself whenever the link is slower than this
+    print(f"📊 Downloaded {downloaded:.2f} MB instead of {downloaded + saved:.2f} MB; "
+          f"break-even link speed {saved / elapsed:.0f} MB/s")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Half-precision compressed model chunks")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    pack_parser = subparsers.add_parser("pack", help="Pack a checkpoint (.pth or .flat) into chunks")
+    pack_parser.add_argument("checkpoint", nargs="?", default="multi_intent_model_reconstructed.pth")
+    pack_parser.add_argument("output_dir", nargs="?", default="packed_chunks")
+    pack_parser.add_argument("--dtype", choices=PACKED_DTYPES, default="float16")
+    pack_parser.add_argument("--codec", choices=sorted(CODECS), default="zlib")
+    pack_parser.add_argument("--level", type=int, help="Compression level (default: the codec's)")
+    pack_parser.add_argument("--chunk-size-mb", type=int, default=DEFAULT_CHUNK_SIZE // (1024 * 1024))
+    pack_parser.add_argument("--config", default="bert-base-uncased",
+                             help="Encoder config name or local directory with config.json")
+
+    reconstruct_parser = subparsers.add_parser("reconstruct", help="Rebuild an fp32 flat file from packed chunks")
+    reconstruct_parser.add_argument("--base-url", help="Packed chunk base URL or local directory")
+    reconstruct_parser.add_argument("--output", default=FLAT_MODEL_PATH)
+
+    for sub in (pack_parser, reconstruct_parser):
+        sub.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pack_model(args.checkpoint, args.output_dir, dtype=args.dtype, codec=args.codec, level=args.level,
+                   chunk_size=args.chunk_size_mb * 1024 * 1024, config=args.config, workers=args.workers)
+    else:
+        reconstruct_packed(base_url=args.base_url, output_path=args.output, workers=args.workers)
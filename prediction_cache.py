@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Exact-match cache of intent probabilities for the Multi-Intent NLP Model
+"""
+import threading
+from collections import OrderedDict
+
+
+def normalize_text(text, lowercase=True):
+    """Normalize text into a cache key (collapse whitespace, optionally lowercase)"""
+    key = " ".join(text.split())
+    return key.lower() if lowercase else key
+
+
+class LRUProbabilityCache:
+    """Bounded LRU cache mapping normalized text to a sigmoid output vector
+
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached probabilities for key, or None on a miss"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, probabilities):
+        """Store probabilities for key, evicting the least recently used entry"""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = probabilities
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'max_size': self.max_size
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
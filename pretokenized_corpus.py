@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Pre-tokenized, memory-mapped corpus format for repeated scoring runs
+
+A corpus is tokenized once into three files sharing a prefix:
+    <prefix>.ids      all token ids back to back (uint16, or int32 for large vocabularies)
+    <prefix>.offsets  int64 start offset of every sequence, plus the end (N + 1 entries)
+    <prefix>.json     tokenizer name, max_length, pad token id, counts
+
+Sequences are stored unpadded; the attention mask of a sequence is all ones
+over its length, so masks are rebuilt from the offsets when batches are
+padded and need no storage of their own.
+
+    python pretokenized_corpus.py utterances.txt corpus/utterances
+"""
+import os
+import json
+import argparse
+import itertools
+
+import numpy as np
+import torch
+
+
+class PretokenizedCorpus:
+    """Read-only view of a pre-tokenized corpus backed by memory-mapped arrays"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        with open(prefix + ".json") as f:
+            self.meta = json.load(f)
+        self.offsets = np.memmap(prefix + ".offsets", dtype=np.int64, mode="r")
+        total_tokens = int(self.offsets[-1])
+        self.ids = (
+            np.memmap(prefix + ".ids", dtype=self.meta["dtype"], mode="r", shape=(total_tokens,))
+            if total_tokens else np.zeros(0, dtype=self.meta["dtype"])
+        )
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return self.ids[self.offsets[index]:self.offsets[index + 1]]
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def pad(self, indices, pad_token_id=None):
+        """Padded (input_ids, attention_mask) tensors for the given sequences"""
+        if pad_token_id is None:
+            pad_token_id = self.meta["pad_token_id"]
+        indices = np.asarray(indices)
+        starts = self.offsets[indices]
+        lengths = self.offsets[indices + 1] - starts
+        longest = int(lengths.max()) if len(lengths) else 0
+
+        positions = np.arange(longest)
+        mask = positions[None, :] < lengths[:, None]
+        gather = np.where(mask, starts[:, None] + positions[None, :], 0)
+        tokens = self.ids[gather] if len(self.ids) else np.zeros_like(gather)
+        input_ids = np.where(mask, tokens, pad_token_id)
+
+        return (
+            torch.from_numpy(input_ids.astype(np.int64)),
+            torch.from_numpy(mask.astype(np.int64))
+        )
+
+    def iter_batches(self, batch_size=32, sort_window=64):
+        """Yield (indices, input_ids, attention_mask) batches
+
+        Within each window of sort_window batches, sequences are sorted by
+        length so every batch is padded only to its longest member.
+        """
+        lengths = self.lengths()
+        window = batch_size * sort_window
+        for window_start in range(0, len(self), window):
+            window_indices = np.arange(window_start, min(window_start + window, len(self)))
+            window_indices = window_indices[np.argsort(lengths[window_indices], kind="stable")]
+            for start in range(0, len(window_indices), batch_size):
+                indices = window_indices[start:start + batch_size]
+                input_ids, attention_mask = self.pad(indices)
+                yield indices, input_ids, attention_mask
+
+
+def build_corpus(texts, prefix, tokenizer, tokenizer_name, max_length=128, chunk_size=4096):
+    """Tokenize an iterable of texts once into the memory-mapped corpus format
+
+    Texts are processed chunk by chunk, so memory use does not depend on
+    the corpus size.
+    """
+    directory = os.path.dirname(prefix)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    dtype = "uint16" if len(tokenizer) <= np.iinfo(np.uint16).max + 1 else "int32"
+    count = 0
+    total_tokens = 0
+
+    with open(prefix + ".ids", "wb") as ids_file, open(prefix + ".offsets", "wb") as offsets_file:
+        offsets_file.write(np.array([0], dtype=np.int64).tobytes())
+        iterator = iter(texts)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                break
+            encoded = tokenizer(chunk, truncation=True, max_length=max_length)["input_ids"]
+            lengths = np.fromiter((len(ids) for ids in encoded), dtype=np.int64, count=len(encoded))
+            ids_file.write(np.fromiter(
+                itertools.chain.from_iterable(encoded), dtype=dtype, count=int(lengths.sum())
+            ).tobytes())
+            offsets_file.write((total_tokens + np.cumsum(lengths)).tobytes())
+            count += len(chunk)
+            total_tokens += int(lengths.sum())
+
+    meta = {
+        "version": 1,
+        "tokenizer": tokenizer_name,
+        "max_length": max_length,
+        "vocab_size": len(tokenizer),
+        "pad_token_id": tokenizer.pad_token_id or 0,
+        "dtype": dtype,
+        "count": count,
+        "total_tokens": total_tokens
+    }
+    with open(prefix + ".json", "w") as f:
+        json.dump(meta, f, indent=2)
+    print(f"✅ Tokenized {count} texts ({total_tokens} tokens) into {prefix}.*")
+    return PretokenizedCorpus(prefix)
+
+
+if __name__ == "__main__":
+    from transformers import AutoTokenizer
+
+    parser = argparse.ArgumentParser(description="Tokenize a corpus once into memory-mapped arrays")
+    parser.add_argument("input", help="Text file, one utterance per line")
+    parser.add_argument("prefix", help="Output prefix (writes .ids, .offsets and .json)")
+    parser.add_argument("--tokenizer", default="bert-base-uncased")
+    parser.add_argument("--max-length", type=int, default=128)
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.tokenizer)
+    with open(args.input, encoding="utf-8") as source:
+        build_corpus((line.rstrip("\n") for line in source), args.prefix, tokenizer,
+                     args.tokenizer, max_length=args.max_length)
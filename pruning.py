@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Structured pruning of attention heads and FFN neurons
+
+Importance is measured on unlabeled calibration texts: every head output
+and every FFN neuron gets a gate fixed at 1, and the importance of a unit
+is the accumulated |d loss / d gate| (the first-order estimate of the loss
+change when the unit is removed), with the full model's own decisions as
+targets. Scores are normalized per layer and ranked across the whole
+encoder; each layer keeps at least one head and one neuron.
+
+Pruned units are sliced out of the weight matrices, so the model really
+gets smaller and faster. The result is an ordinary state dict that
+load_model_with_architecture / build_model_from_state_dict load with the
+original config (layer sizes are taken from the tensors):
+
+    python pruning.py calibration.txt --eval held_out.txt --levels 0.1,0.2,0.3,0.4 \\
+        --save-level 0.3 --output pruned.pth --flat pruned.flat
+    model = load_model_with_architecture("pruned.pth", config="bert-base-uncased")
+    predictor = MultiIntentPredictor(weights_path="pruned.flat")
+"""
+import time
+import argparse
+
+import torch
+import torch.nn.functional as F
+
+from model_architecture import build_model_from_state_dict
+from mmap_weights import save_flat_weights
+from evaluation import compare_probabilities
+from inference_engines import inference_mode
+
+PRUNED_MODEL_PATH = "multi_intent_model_pruned.pth"
+DEFAULT_LEVELS = (0.1, 0.2, 0.3, 0.4, 0.5)
+
+
+def _layers(model):
+    return model.bert.encoder.layer
+
+
+def _gate_hook(gate, repeat=1):
+    """Forward pre-hook multiplying a Linear's input features by gate"""
+    def hook(module, args):
+        scale = gate.repeat_interleave(repeat) if repeat > 1 else gate
+        return (args[0] * scale,) + args[1:]
+    return hook
+
+
+def score_importance(predictor, texts, batch_size=32, threshold=0.5):
+    """Importance of every head and FFN neuron: ([layers, heads], [layers, neurons])"""
+    model = predictor.load_model()
+    layers = _layers(model)
+    head_gates, neuron_gates, handles = [], [], []
+    for layer in layers:
+        attention = layer.attention.self
+        head_gates.append(torch.ones(attention.num_attention_heads, requires_grad=True))
+        neuron_gates.append(torch.ones(layer.intermediate.dense.out_features, requires_grad=True))
+        handles.append(layer.attention.output.dense.register_forward_pre_hook(
+            _gate_hook(head_gates[-1], attention.attention_head_size)
+        ))
+        handles.append(layer.output.dense.register_forward_pre_hook(_gate_hook(neuron_gates[-1])))
+
+    head_importance = [torch.zeros_like(gate) for gate in head_gates]
+    neuron_importance = [torch.zeros_like(gate) for gate in neuron_gates]
+    try:
+        with torch.enable_grad():
+            for _, input_ids, attention_mask in predictor._iter_padded(predictor._encode(texts), batch_size):
+                logits = model(input_ids, attention_mask)
+                targets = (torch.sigmoid(logits) > threshold).float().detach()
+                loss = F.binary_cross_entropy_with_logits(logits, targets, reduction="sum")
+                gradients = torch.autograd.grad(loss, head_gates + neuron_gates)
+                for total, gradient in zip(head_importance + neuron_importance, gradients):
+                    total += gradient.abs()
+    finally:
+        for handle in handles:
+            handle.remove()
+
+    def normalized(rows):
+        scores = torch.stack(rows)
+        return scores / scores.norm(dim=1, keepdim=True).clamp(min=1e-12)
+
+    return normalized(head_importance), normalized(neuron_importance)
+
+
+def _keep_indices(importance, sparsity):
+    """Per layer, the sorted indices that survive removing the sparsity share globally"""
+    num_remove = min(int(round(sparsity * importance.numel())), importance.numel() - len(importance))
+    protected = importance.clone()
+    protected[torch.arange(len(importance)), importance.argmax(dim=1)] = float("inf")
+    removed = torch.zeros(importance.numel(), dtype=torch.bool)
+    removed[protected.flatten().argsort()[:num_remove]] = True
+    removed = removed.view_as(importance)
+    return [torch.nonzero(~row).flatten() for row in removed]
+
+
+def prune_state_dict(state_dict, kept_heads, kept_neurons, head_size):
+    """Copy of state_dict with only the kept heads and FFN neurons of each layer"""
+    pruned = dict(state_dict)
+    for i, (heads, neurons) in enumerate(zip(kept_heads, kept_neurons)):
+        prefix = f"bert.encoder.layer.{i}."
+        rows = (heads[:, None] * head_size + torch.arange(head_size)).flatten()
+        for name in ("query", "key", "value"):
+            for leaf in ("weight", "bias"):
+                key = f"{prefix}attention.self.{name}.{leaf}"
+                pruned[key] = state_dict[key].index_select(0, rows)
+        key = f"{prefix}attention.output.dense.weight"
+        pruned[key] = state_dict[key].index_select(1, rows)
+        for leaf in ("weight", "bias"):
+            key = f"{prefix}intermediate.dense.{leaf}"
+            pruned[key] = state_dict[key].index_select(0, neurons)
+        key = f"{prefix}output.dense.weight"
+        pruned[key] = state_dict[key].index_select(1, neurons)
+    return pruned
+
+
+def prune_model(model, head_importance, neuron_importance, head_sparsity, ffn_sparsity=None):
+    """New, physically smaller model without the least important heads and FFN neurons
+
+    The sparsities are the shares of all heads / all neurons to remove.
+    model itself is left unchanged.
+    """
+    ffn_sparsity = head_sparsity if ffn_sparsity is None else ffn_sparsity
+    head_size = _layers(model)[0].attention.self.attention_head_size
+    state_dict = prune_state_dict(
+        model.state_dict(),
+        _keep_indices(head_importance, head_sparsity),
+        _keep_indices(neuron_importance, ffn_sparsity),
+        head_size
+    )
+    return build_model_from_state_dict(state_dict, config=model.bert.config)
+
+
+def pruned_structure(model):
+    """Heads and FFN neurons per layer, and the encoder's parameter count"""
+    return {
+        'heads': [layer.attention.self.num_attention_heads for layer in _layers(model)],
+        'ffn_neurons': [layer.intermediate.dense.out_features for layer in _layers(model)],
+        'encoder_parameters': sum(p.numel() for p in model.bert.encoder.parameters())
+    }
+
+
+def _score(model, batches):
+    """Probabilities of the batched texts in input order, and the best forward time of 3 runs"""
+    num_texts = sum(len(bucket) for bucket, _, _ in batches)
+    probabilities = torch.empty(num_texts, model.classifier.out_features)
+    best = float("inf")
+    with inference_mode():
+        for _ in range(3):
+            started = time.perf_counter()
+            for bucket, input_ids, attention_mask in batches:
+                probabilities[bucket] = torch.sigmoid(model(input_ids, attention_mask))
+            best = min(best, time.perf_counter() - started)
+    return probabilities, best
+
+
+def evaluate_sparsity_levels(predictor, calibration_texts, eval_texts, levels=DEFAULT_LEVELS,
+                             batch_size=32, threshold=0.5, importance=None):
+    """Prune at every level and compare each model with the full one on eval_texts
+
+    Returns (report, importance); the report has one entry per level with
+    the structure, forward latency and compare_probabilities agreement.
+    Pass importance back in to skip re-scoring.
+    """
+    model = predictor.load_model()
+    if importance is None:
+        importance = score_importance(predictor, calibration_texts, batch_size, threshold)
+    eval_texts = list(eval_texts)
+    batches = list(predictor._iter_padded(predictor._encode(eval_texts), batch_size))
+    reference, reference_seconds = _score(model, batches)
+
+    report = [dict(pruned_structure(model), sparsity=0.0, latency_ms=reference_seconds * 1000,
+                   speedup=1.0, exact_match_rate=1.0, per_intent_agreement={})]
+    for sparsity in levels:
+        pruned = prune_model(model, *importance, sparsity)
+        probabilities, seconds = _score(pruned, batches)
+        comparison = compare_probabilities(reference, probabilities, predictor.intent_labels,
+                                           threshold=threshold, texts=eval_texts)
+        report.append(dict(
+            pruned_structure(pruned),
+            sparsity=sparsity,
+            latency_ms=seconds * 1000,
+            speedup=reference_seconds / seconds,
+            exact_match_rate=comparison['exact_match_rate'],
+            mean_abs_deviation=comparison['mean_abs_deviation'],
+            per_intent_agreement={
+                label: stats['agreement'] for label, stats in comparison['per_intent'].items()
+            }
+        ))
+    return report, importance
+
+
+def print_sparsity_report(report):
+    print("\n📊 Pruning levels (latency over the evaluation set)")
+    for entry in report:
+        print(f"   sparsity {entry['sparsity']:.0%}: {sum(entry['heads'])} heads, "
+              f"{sum(entry['ffn_neurons'])} FFN neurons, "
+              f"{entry['encoder_parameters'] / 1e6:.1f}M params, {entry['latency_ms']:.1f} ms "
+              f"({entry['speedup']:.2f}x), exact match {entry['exact_match_rate']:.1%}")
+        if entry['per_intent_agreement']:
+            worst = sorted(entry['per_intent_agreement'].items(), key=lambda item: item[1])[:3]
+            print("      lowest agreement: " + ", ".join(f"{label} {value:.1%}" for label, value in worst))
+
+
+def save_pruned_model(model, path=PRUNED_MODEL_PATH, flat_path=None):
+    """Save the pruned state dict for load_model_with_architecture, and optionally as a flat file"""
+    state_dict = {name: tensor.contiguous() for name, tensor in model.state_dict().items()}
+    torch.save(state_dict, path)
+    print(f"✅ Pruned model saved to {path}")
+    if flat_path is not None:
+        metadata = {
+            "num_intents": model.classifier.out_features,
+            "config": model.bert.config.to_dict(),
+            "pruned": pruned_structure(model)
+        }
+        save_flat_weights(state_dict, flat_path, metadata=metadata)
+        print(f"✅ Memory-mapped copy saved to {flat_path}")
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Prune attention heads and FFN neurons and report the trade-off")
+    parser.add_argument("input", help="Calibration texts, one unlabeled utterance per line")
+    parser.add_argument("--eval", help="Evaluation texts (default: the calibration texts)")
+    parser.add_argument("--weights", help="Memory-mapped weights from mmap_weights.py")
+    parser.add_argument("--levels", help="Comma list of sparsities (shares of heads and neurons removed)")
+    parser.add_argument("--ffn-sparsity", type=float,
+                        help="Separate FFN sparsity for --save-level (default: the same)")
+    parser.add_argument("--save-level", type=float, help="Sparsity of the model to save")
+    parser.add_argument("--output", default=PRUNED_MODEL_PATH)
+    parser.add_argument("--flat", help="Also write the pruned model in the memory-mapped format")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    def read_lines(path):
+        with open(path, encoding="utf-8") as f:
+            return [line.strip() for line in f if line.strip()]
+
+    calibration_texts = read_lines(args.input)
+    eval_texts = read_lines(args.eval) if args.eval else calibration_texts
+
+    predictor = MultiIntentPredictor(weights_path=args.weights, cache_size=0)
+    report, importance = evaluate_sparsity_levels(
+        predictor,
+        calibration_texts,
+        eval_texts,
+        levels=[float(v) for v in args.levels.split(",")] if args.levels else DEFAULT_LEVELS,
+        batch_size=args.batch_size,
+        threshold=args.threshold
+    )
+    print_sparsity_report(report)
+
+    if args.save_level is not None:
+        pruned = prune_model(predictor.load_model(), *importance, args.save_level, args.ffn_sparsity)
+        save_pruned_model(pruned, args.output, args.flat)
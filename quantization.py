@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Dynamic int8 quantization for CPU inference with the Multi-Intent NLP Model
+"""
+import copy
+import argparse
+
+import torch
+import torch.nn as nn
+
+from model_architecture import MultiIntentClassifier, init_empty_weights
+from evaluation import compare_predictors, print_comparison
+from safe_model_loader import safe_torch_load
+
+try:
+    from torch.ao.quantization import quantize_dynamic
+except ImportError:  # PyTorch < 1.10
+    from torch.quantization import quantize_dynamic
+
+QUANTIZED_MODEL_PATH = "multi_intent_model_int8.pth"
+
+
+def quantize_model(model, inplace=False):
+    """Apply dynamic int8 quantization to every Linear layer (encoder and classifier head)"""
+    model.eval()
+    quantized = quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8, inplace=inplace)
+    quantized.is_quantized = True
+    return quantized
+
+
+def save_quantized_model(model, path=QUANTIZED_MODEL_PATH):
+    """Save a quantized model together with the config needed to rebuild it"""
+    torch.save({
+        'state_dict': model.state_dict(),
+        'config': model.bert.config.to_dict(),
+        'num_intents': model.classifier.out_features
+    }, path)
+    print(f"✅ Quantized model saved to {path}")
+
+
+def _materialize_zeros(model):
+    """Replace meta parameters with zero tensors (placeholders for quantization)"""
+    for module in model.modules():
+        for name, param in module._parameters.items():
+            if param is not None and param.is_meta:
+                module._parameters[name] = nn.Parameter(
+                    torch.zeros(param.shape, dtype=param.dtype),
+                    requires_grad=False
+                )
+    return model
+
+
+def load_quantized_model(path=QUANTIZED_MODEL_PATH):
+    """Load a model written by save_quantized_model"""
+    checkpoint = safe_torch_load(path)
+
+    # Build the fp32 skeleton without initializing weights, quantize it so
+    # the module types match, then load the int8 weights
+    with init_empty_weights():
+        model = MultiIntentClassifier(
+            num_intents=checkpoint['num_intents'],
+            config=checkpoint['config']
+        )
+    model = quantize_model(_materialize_zeros(model), inplace=True)
+    model.load_state_dict(checkpoint['state_dict'])
+    model.eval()
+    return model
+
+
+def check_quantization(predictor, texts, threshold=0.5, batch_size=32):
+    """Compare an fp32 predictor against a quantized copy of its model
+
+    Returns the report from evaluation.compare_probabilities: maximum
+    per-intent deviation and every decision flipped at the threshold.
+    """
+    reference_model = predictor.load_model()
+    candidate = copy.copy(predictor)
+    candidate.cache = None
+    candidate.model = quantize_model(reference_model)
+    return compare_predictors(predictor, candidate, texts, threshold=threshold, batch_size=batch_size)
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Quantize the model and check its accuracy")
+    parser.add_argument("--output", default=QUANTIZED_MODEL_PATH, help="Quantized model path")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    args = parser.parse_args()
+
+    reference_texts = [
+        "I want to book a flight and hotel for my vacation",
+        "My order hasn't arrived yet, can you help?",
+        "I need to cancel my reservation and get a refund",
+        "How do I change my booking details?",
+        "Please confirm my booking and let me know payment options",
+        "I'm unhappy with my purchase and want to provide feedback",
+        "What are your opening hours and do you offer customer support?",
+        "Thank you for your service"
+    ]
+
+    predictor = MultiIntentPredictor()
+    report = check_quantization(predictor, reference_texts, threshold=args.threshold)
+    print_comparison(report)
+
+    save_quantized_model(quantize_model(predictor.load_model()), args.output)
@@ -1,48 +1,370 @@
 #!/usr/bin/env python3
 import os
-import requests
-import base64
 import json
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import METRICS
+
+DEFAULT_BASE_URL = "https://raw.githubusercontent.com/HariGW-0/multi-intent-nlp-model/main/model_chunks"
+MODEL_PATH = "multi_intent_model_reconstructed.pth"
+TOTAL_CHUNKS = 84
+DEFAULT_WORKERS = 8
+STREAM_BLOCK_SIZE = 1024 * 1024
+MANIFEST_NAME = "manifest.json"
+CHECK_TIMEOUT = 5
+
+def get_base_url(base_url=None):
+    """Chunk location: explicit argument, MULTI_INTENT_CHUNKS_URL, or GitHub"""
+    return base_url or os.environ.get("MULTI_INTENT_CHUNKS_URL") or DEFAULT_BASE_URL
+
+def chunk_filename(chunk_number):
+    return f"model_chunk_{chunk_number:03d}.bin"
+
+def _local_path(location):
+    """Return a filesystem path for local locations, or None for HTTP(S) URLs"""
+    parsed = urlparse(location)
+    if parsed.scheme in ("http", "https"):
+        return None
+    if parsed.scheme == "file":
+        return url2pathname(parsed.path)
+    return location
+
+def join_location(base_url, name):
+    """Join a file name onto a base URL or local directory"""
+    if urlparse(base_url).scheme in ("http", "https", "file"):
+        return base_url.rstrip("/") + "/" + name
+    return os.path.join(base_url, name)
+
+def create_session(workers=DEFAULT_WORKERS, max_retries=3):
+    """HTTP session whose connection pool is sized for the worker count"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers, max_retries=max_retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Chunk sizes must match the bytes written, so ask for uncompressed bodies
+    session.headers["Accept-Encoding"] = "identity"
+    return session
+
+def remote_size(location, session):
+    """Size in bytes of a chunk at a URL or local path"""
+    path = _local_path(location)
+    if path is not None:
+        return os.path.getsize(path)
+
+    response = session.head(location, allow_redirects=True, timeout=30)
+    response.raise_for_status()
+    length = response.headers.get("Content-Length")
+    if length is None:
+        raise RuntimeError(f"No Content-Length for {location}")
+    return int(length)
+
+def iter_location(location, session, block_size=STREAM_BLOCK_SIZE, timeout=60):
+    """Stream the bytes of a URL or local path in blocks"""
+    path = _local_path(location)
+    if path is not None:
+        with open(path, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                yield block
+        return
+
+    with session.get(location, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        for block in response.iter_content(chunk_size=block_size):
+            if block:
+                yield block
+
+def fetch_to_offset(location, output_path, offset, expected_size, session):
+    """Stream one chunk straight into output_path at the given offset
+
+    Returns the SHA-256 hex digest of the bytes written.
+    """
+    written = 0
+    digest = hashlib.sha256()
+    with open(output_path, "r+b") as f:
+        f.seek(offset)
+        for block in iter_location(location, session):
+            written += len(block)
+            if written > expected_size:
+                raise RuntimeError(f"{location} is larger than {expected_size} bytes")
+            digest.update(block)
+            f.write(block)
+    if written != expected_size:
+        raise RuntimeError(f"{location}: expected {expected_size} bytes, got {written}")
+    return digest.hexdigest()
+
+def file_sha256(path, offset=0, length=None, block_size=STREAM_BLOCK_SIZE):
+    """SHA-256 of a file, or of length bytes starting at offset"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = block_size if remaining is None else min(block_size, remaining)
+            block = f.read(size)
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return digest.hexdigest()
+
+def build_manifest(chunk_dir, output_path=None):
+    """Write a manifest listing every chunk's size, offset and hash plus the final file hash"""
+    names = sorted(
+        name for name in os.listdir(chunk_dir)
+        if name.startswith("model_chunk_") and name.endswith(".bin")
+    )
+    if not names:
+        raise FileNotFoundError(f"No model_chunk_*.bin files in {chunk_dir}")
+
+    chunks = []
+    total = hashlib.sha256()
+    offset = 0
+    for name in names:
+        path = os.path.join(chunk_dir, name)
+        digest = hashlib.sha256()
+        for block in iter_location(path, None):
+            digest.update(block)
+            total.update(block)
+        size = os.path.getsize(path)
+        chunks.append({"name": name, "offset": offset, "size": size, "sha256": digest.hexdigest()})
+        offset += size
+
+    manifest = {
+        "version": 1,
+        "total_size": offset,
+        "sha256": total.hexdigest(),
+        "chunks": chunks
+    }
+
+    output_path = output_path or os.path.join(chunk_dir, MANIFEST_NAME)
+    with open(output_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    print(f"📝 Manifest with {len(chunks)} chunks written to {output_path}")
+    return manifest
+
+def load_manifest(base_url, session, timeout=60):
+    """Fetch the chunk manifest from base_url, or None if there is none"""
+    location = join_location(base_url, MANIFEST_NAME)
+    try:
+        return json.loads(b"".join(iter_location(location, session, timeout=timeout)))
+    except (OSError, requests.RequestException):
+        return None
+
+def verify_model_file(path, manifest):
+    """True if path has exactly the size and hash recorded in the manifest"""
+    if not os.path.exists(path) or os.path.getsize(path) != manifest["total_size"]:
+        return False
+    return file_sha256(path) == manifest["sha256"]
 
-def download_chunk_from_github(chunk_number):
+def check_model_file(path, base_url=None):
+    """False if a configured chunk source publishes a manifest and path does not match it
+
+    Only an explicit base_url or MULTI_INTENT_CHUNKS_URL is consulted, with
+    a short timeout and no retries, so startup never waits on GitHub. The
+    file hash is memoized on (size, mtime) like engine cache fingerprints.
+    Without a source or a manifest, an existing file is accepted.
+    """
+    base_url = base_url or os.environ.get("MULTI_INTENT_CHUNKS_URL")
+    if not base_url:
+        return True
+    session = create_session(1, max_retries=0)
+    try:
+        manifest = load_manifest(base_url, session, timeout=CHECK_TIMEOUT)
+    finally:
+        session.close()
+    if manifest is None:
+        return True
+    if os.path.getsize(path) != manifest["total_size"]:
+        return False
+    from inference_engines import checkpoint_fingerprint
+    return checkpoint_fingerprint(path) == manifest["sha256"]
+
+def _load_progress(path, base_url, chunks):
+    """{chunk name: sha256} of the chunks a .part.json sidecar records as complete
+
+    Only entries from the same source whose offset and size still match
+    the current chunk list are returned.
+    """
+    try:
+        with open(path) as f:
+            progress = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if progress.get("base_url") != base_url:
+        return {}
+    layout = {chunk["name"]: (chunk["offset"], chunk["size"]) for chunk in chunks}
+    return {
+        name: entry["sha256"] for name, entry in progress.get("chunks", {}).items()
+        if layout.get(name) == (entry["offset"], entry["size"])
+    }
+
+def _save_progress(path, base_url, completed):
+    with open(path + ".tmp", "w") as f:
+        json.dump({"base_url": base_url, "chunks": completed}, f)
+    os.replace(path + ".tmp", path)
+
+def _legacy_manifest(base_url, session, pool, total_chunks):
+    """Chunk list without hashes for sources that publish no manifest"""
+    names = [chunk_filename(i) for i in range(1, total_chunks + 1)]
+    sizes = list(pool.map(lambda name: remote_size(join_location(base_url, name), session), names))
+    chunks = []
+    offset = 0
+    for name, size in zip(names, sizes):
+        chunks.append({"name": name, "offset": offset, "size": size, "sha256": None})
+        offset += size
+    return {"total_size": offset, "sha256": None, "chunks": chunks}
+
+def download_chunk_from_github(chunk_number, base_url=None, session=None):
     """Download a single chunk from GitHub"""
-    url = f"https://raw.githubusercontent.com/HariGW-0/multi-intent-nlp-model/main/model_chunks/model_chunk_{chunk_number:03d}.bin"
+    url = join_location(get_base_url(base_url), chunk_filename(chunk_number))
     try:
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.content
-        else:
-            print(f"Failed to download chunk {chunk_number}")
-            return None
+        return b"".join(iter_location(url, session or requests))
     except Exception as e:
         print(f"Error downloading chunk {chunk_number}: {e}")
         return None
 
-def reconstruct_model():
-    """Reconstruct the model by downloading all chunks"""
-    print("🔧 Reconstructing model from GitHub chunks...")
-    
-    total_chunks = 84
-    all_data = b''
-    
-    for i in range(1, total_chunks + 1):
-        print(f"📥 Downloading chunk {i}/{total_chunks}...")
-        chunk_data = download_chunk_from_github(i)
-        if chunk_data is None:
-            print("❌ Failed to reconstruct model")
-            return False
-        
-        all_data += chunk_data
-        chunk_size_mb = len(chunk_data) / (1024 * 1024)
-        print(f"✅ Chunk {i} downloaded ({chunk_size_mb:.2f} MB)")
-    
-    # Save reconstructed model
-    with open("multi_intent_model_reconstructed.pth", "wb") as f:
-        f.write(all_data)
-    
+def reconstruct_model(base_url=None, output_path=MODEL_PATH, workers=DEFAULT_WORKERS,
+                      total_chunks=TOTAL_CHUNKS):
+    """Reconstruct the model by downloading all chunks
+
+    Chunks are fetched in parallel over a pooled session and written straight
+    to their offsets in a preallocated file, which is renamed into place once
+    every chunk has arrived.
+
+    When the source publishes a manifest.json, an existing model file is
+    verified and kept if intact, chunks already present in a leftover .part
+    file are reused, and only missing or corrupt chunks are fetched again.
+    Without a manifest, total_chunks chunks are fetched unverified; the
+    size and hash of every completed chunk are recorded in a .part.json
+    sidecar, so an interrupted run still resumes from the intact ones.
+    """
+    with METRICS.time("reconstruct"):
+        return _reconstruct_model(base_url, output_path, workers, total_chunks)
+
+def _reconstruct_model(base_url, output_path, workers, total_chunks):
+    base_url = get_base_url(base_url)
+    print(f"🔧 Reconstructing model from {base_url} ({workers} workers)...")
+
+    session = create_session(workers)
+    part_path = output_path + ".part"
+    progress_path = part_path + ".json"
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            manifest = load_manifest(base_url, session)
+            if manifest is None:
+                print("⚠️ No manifest found, chunks will not be verified")
+                manifest = _legacy_manifest(base_url, session, pool, total_chunks)
+            elif verify_model_file(output_path, manifest):
+                print("✅ Existing model matches the manifest, nothing to download")
+                return True
+            elif os.path.exists(output_path) and not os.path.exists(part_path):
+                # Salvage the intact chunks of an incomplete or corrupt model file
+                os.replace(output_path, part_path)
+
+            chunks = manifest["chunks"]
+            total_size = manifest["total_size"]
+            verified = manifest["sha256"] is not None
+            resumable = os.path.exists(part_path)
+            if verified:
+                expected = {chunk["name"]: chunk["sha256"] for chunk in chunks}
+            else:
+                # Without a manifest, the sidecar of an earlier run supplies the hashes
+                expected = _load_progress(progress_path, base_url, chunks) if resumable else {}
+
+            with open(part_path, "r+b" if resumable else "wb") as f:
+                f.truncate(total_size)
+
+            def intact(chunk):
+                digest = expected.get(chunk["name"])
+                return digest is not None and file_sha256(part_path, chunk["offset"], chunk["size"]) == digest
+
+            if resumable and expected:
+                cached = list(pool.map(intact, chunks))
+                pending = [c for c, ok in zip(chunks, cached) if not ok]
+                METRICS.inc("multi_intent_chunks_reused_total", len(chunks) - len(pending),
+                            help_text="Model chunks reused from a previous partial download")
+                print(f"♻️ Reusing {len(chunks) - len(pending)}/{len(chunks)} cached chunks")
+            else:
+                pending = list(chunks)
+
+            lock = threading.Lock()
+            done = [0]
+            pending_names = {chunk["name"] for chunk in pending}
+            completed = {
+                c["name"]: {"offset": c["offset"], "size": c["size"], "sha256": expected[c["name"]]}
+                for c in chunks if c["name"] not in pending_names
+            }
+
+            def fetch(chunk):
+                digest = fetch_to_offset(
+                    join_location(base_url, chunk["name"]), part_path,
+                    chunk["offset"], chunk["size"], session
+                )
+                if chunk["sha256"] is not None and digest != chunk["sha256"]:
+                    raise RuntimeError(f"Checksum mismatch for {chunk['name']}")
+                METRICS.inc("multi_intent_chunks_downloaded_total",
+                            help_text="Model chunks fetched during reconstruction")
+                METRICS.inc("multi_intent_chunk_bytes_downloaded_total", chunk["size"],
+                            help_text="Bytes fetched during reconstruction")
+                with lock:
+                    if not verified:
+                        completed[chunk["name"]] = {"offset": chunk["offset"], "size": chunk["size"],
+                                                    "sha256": digest}
+                        _save_progress(progress_path, base_url, completed)
+                    done[0] += 1
+                    print(f"✅ {chunk['name']} downloaded ({chunk['size'] / (1024 * 1024):.2f} MB) "
+                          f"[{done[0]}/{len(pending)}]")
+
+            futures = [pool.submit(fetch, chunk) for chunk in pending]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    except Exception as e:
+        print(f"❌ Failed to reconstruct model: {e}")
+        print("💡 Downloaded chunks are kept and will be reused on the next run")
+        return False
+    finally:
+        session.close()
+
+    if manifest["sha256"] is not None and file_sha256(part_path) != manifest["sha256"]:
+        print("❌ Reconstructed file does not match the manifest hash")
+        return False
+
+    os.replace(part_path, output_path)
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+
     print(f"🎉 Model reconstructed successfully!")
-    print(f"📊 Final size: {len(all_data)/(1024*1024):.2f} MB")
+    print(f"📊 Final size: {total_size/(1024*1024):.2f} MB")
     return True
 
 if __name__ == "__main__":
-    reconstruct_model()
+    parser = argparse.ArgumentParser(description="Reconstruct the model checkpoint from chunks")
+    parser.add_argument("--base-url", help="Chunk base URL or local directory (default: GitHub)")
+    parser.add_argument("--output", default=MODEL_PATH, help="Reconstructed checkpoint path")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Parallel downloads")
+    parser.add_argument("--build-manifest", metavar="CHUNK_DIR",
+                        help="Write manifest.json for the chunks in CHUNK_DIR and exit")
+    args = parser.parse_args()
+
+    if args.build_manifest:
+        build_manifest(args.build_manifest)
+    else:
+        reconstruct_model(base_url=args.base_url, output_path=args.output, workers=args.workers)
@@ -33,19 +33,25 @@ def safe_torch_load(model_path, map_location='cpu'):
     raise RuntimeError(error_msg)
 
 class MultiIntentModel:
-    def __init__(self):
+    def __init__(self, model_path="multi_intent_model_reconstructed.pth"):
         self.model = None
+        self.model_path = model_path
     
     def load(self):
         """Load the model, reconstructing if necessary"""
-        from reconstruct_from_github import reconstruct_model
+        from reconstruct_from_github import reconstruct_model, check_model_file
         
-        model_path = "multi_intent_model_reconstructed.pth"
+        model_path = self.model_path
         
         # Reconstruct if needed
         if not os.path.exists(model_path):
             print("📦 Model not found. Reconstructing from GitHub chunks...")
-            if not reconstruct_model():
+            if not reconstruct_model(output_path=model_path):
+                raise Exception("Failed to reconstruct model")
+        elif not check_model_file(model_path):
+            # Intact chunks of the damaged file are reused
+            print("⚠️ Model does not match the published manifest. Reconstructing...")
+            if not reconstruct_model(output_path=model_path):
                 raise Exception("Failed to reconstruct model")
         
         # Load the model safely
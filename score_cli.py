@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Streaming scoring CLI for the Multi-Intent NLP Model
+
+Reads JSONL or CSV from a file or stdin, scores it in batches and writes
+one JSON line per record as each batch finishes. Everything is a
+generator, so memory stays flat regardless of input size.
+
+    python score_cli.py utterances.jsonl -o scores.jsonl
+    cat calls.csv | python score_cli.py - --format csv --text-field transcript
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import itertools
+from contextlib import redirect_stdout
+
+
+def detect_format(path):
+    """Guess the input format from the file extension (stdin defaults to JSONL)"""
+    extension = os.path.splitext(path)[1].lower()
+    return "csv" if extension in (".csv", ".tsv") else "jsonl"
+
+
+def read_records(stream, fmt="jsonl", text_field="text", delimiter=","):
+    """Yield (record dict, text) pairs from a JSONL or CSV stream
+
+    JSONL lines may be objects (text taken from text_field) or bare strings.
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(stream, delimiter=delimiter):
+            yield row, row.get(text_field) or ""
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            raise ValueError(f"Line {line_number} is not valid JSON")
+        if isinstance(record, str):
+            yield {text_field: record}, record
+        else:
+            yield record, str(record.get(text_field) or "")
+
+
+def batched(iterable, batch_size):
+    """Yield lists of up to batch_size items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def score_stream(records, predictor, batch_size=64, threshold=0.5, long_text=False, stride=None,
+                 reduction="max"):
+    """Yield output records (input fields plus intents and probabilities) batch by batch
+
+    With long_text, texts are not truncated but scored in overlapping
+    windows (see MultiIntentPredictor.analyze_long).
+    """
+    for batch in batched(records, batch_size):
+        texts = [text for _, text in batch]
+        if long_text:
+            results = predictor.analyze_long(texts, threshold=threshold, batch_size=batch_size,
+                                             stride=stride, reduction=reduction)
+        else:
+            results = predictor.analyze_many(texts, threshold=threshold, batch_size=batch_size)
+        for (record, _), result in zip(batch, results):
+            output = dict(record)
+            output["intents"] = result.intents
+            output["probabilities"] = result.probabilities
+            yield output
+
+
+class ProgressReporter:
+    """Periodic throughput report on stderr"""
+
+    def __init__(self, interval=10.0, stream=sys.stderr):
+        self.interval = interval
+        self.stream = stream
+        self.start_time = time.time()
+        self.last_report = self.start_time
+        self.count = 0
+
+    def update(self, count=1):
+        self.count += count
+        now = time.time()
+        if self.interval and now - self.last_report >= self.interval:
+            self.last_report = now
+            self.report()
+
+    def report(self, final=False):
+        elapsed = time.time() - self.start_time
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        marker = "✅ Done:" if final else "⏳"
+        print(f"{marker} {self.count} records in {elapsed:.1f}s ({rate:.1f} records/s)",
+              file=self.stream, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score JSONL/CSV utterances with the Multi-Intent model")
+    parser.add_argument("input", help="Input file, or - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="Output JSONL file (default: stdout)")
+    parser.add_argument("--format", choices=["jsonl", "csv", "tsv"], help="Input format (default: by extension)")
+    parser.add_argument("--text-field", default="text", help="JSON field / CSV column holding the text")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--progress-interval", type=float, default=10.0,
+                        help="Seconds between progress reports on stderr (0 to disable)")
+    parser.add_argument("--weights", help="Memory-mapped weights from mmap_weights.py")
+    parser.add_argument("--engine", default="auto", choices=["auto", "traced", "eager"])
+    parser.add_argument("--quantized", action="store_true", help="Use dynamic int8 quantization")
+    parser.add_argument("--long-text", action="store_true",
+                        help="Score texts past max_length in overlapping windows instead of truncating")
+    parser.add_argument("--stride", type=int, help="Tokens shared by consecutive windows (default: half a window)")
+    parser.add_argument("--reduction", choices=["max", "mean"], default="max",
+                        help="How window probabilities are combined per text")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Print per-stage timings as a JSON log line on stderr when done")
+    args = parser.parse_args(argv)
+
+    from inference_example import MultiIntentPredictor
+    from metrics import METRICS, enable_metrics
+
+    if args.metrics:
+        enable_metrics()
+
+    fmt = args.format or ("jsonl" if args.input == "-" else detect_format(args.input))
+    delimiter = "\t" if fmt == "tsv" or args.input.lower().endswith(".tsv") else ","
+    if fmt == "tsv":
+        fmt = "csv"
+
+    predictor = MultiIntentPredictor(weights_path=args.weights, engine=args.engine,
+                                     quantized=args.quantized)
+
+    # Loader messages go to stderr so they never mix with JSONL on stdout
+    with redirect_stdout(sys.stderr):
+        predictor.get_engine()
+
+    source = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    progress = ProgressReporter(interval=args.progress_interval)
+    try:
+        records = read_records(source, fmt, args.text_field, delimiter)
+        for output in score_stream(records, predictor, args.batch_size, args.threshold,
+                                   args.long_text, args.stride, args.reduction):
+            sink.write(json.dumps(output, ensure_ascii=False) + "\n")
+            progress.update()
+            if progress.count % args.batch_size == 0:
+                sink.flush()
+        sink.flush()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    progress.report(final=True)
+    if args.metrics:
+        print(METRICS.log_line(), file=sys.stderr, flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate cache of intent probabilities
+
+Paraphrases such as "cancel my booking" and "please cancel the booking"
+miss the exact-text cache. SemanticCache keeps a cheap embedding of each
+recently scored text in a fixed-size NumPy ring buffer and answers a new
+text with the probabilities of its nearest neighbour when their cosine
+similarity is at least min_similarity. No BERT layer runs for a hit.
+
+Embeddings cost no forward pass: HashedEmbedder hashes word and character
+n-grams into a fixed-size vector; TokenEmbedder averages the model's own
+word-piece embeddings.
+
+A hit is an approximation, so a share of hits (audit_rate) is also scored
+in full and compared, which gives the error rate of the cache in service.
+evaluate_similarity_bounds replays a text file through the cache at
+several bounds to pick one offline.
+
+    predictor = MultiIntentPredictor(semantic_cache=SemanticCache(min_similarity=0.9, audit_rate=0.05))
+    predictor.semantic_cache.stats()   # hit rate, audited hits, intent-set error rate
+
+    python semantic_cache.py utterances.txt --bounds 0.8,0.85,0.9,0.95
+"""
+import zlib
+import random
+import argparse
+import threading
+
+import numpy as np
+import torch
+
+from prediction_cache import normalize_text
+
+DEFAULT_BOUNDS = (0.75, 0.8, 0.85, 0.9, 0.95, 0.98)
+
+
+def _normalize_rows(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class HashedEmbedder:
+    """Bag of word unigrams, word bigrams and character n-grams hashed into dim buckets"""
+
+    def __init__(self, dim=1024, char_ngram=3):
+        self.dim = dim
+        self.char_ngram = char_ngram
+
+    def _features(self, text):
+        words = normalize_text(text).split()
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        padded = f" {' '.join(words)} "
+        n = self.char_ngram
+        features += [padded[i:i + n] for i in range(len(padded) - n + 1)]
+        return features
+
+    def __call__(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            # crc32 rather than hash(): string hashes change between processes
+            buckets = [zlib.crc32(feature.encode("utf-8")) % self.dim for feature in self._features(text)]
+            np.add.at(vectors[row], buckets, 1.0)
+        return _normalize_rows(vectors)
+
+
+class TokenEmbedder:
+    """Mean of the model's word-piece embeddings over each text's tokens (no encoder layers)"""
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+
+    def __call__(self, texts):
+        word_embeddings = self.predictor.load_model().bert.embeddings.word_embeddings
+        # Drop [CLS] and [SEP]; empty texts keep them so every bag has a token
+        pieces = [ids[1:-1] or ids for ids in self.predictor._encode(texts)]
+        offsets = torch.tensor([0] + [len(ids) for ids in pieces[:-1]]).cumsum(dim=0)
+        flat = torch.tensor([token for ids in pieces for token in ids])
+        with torch.inference_mode():
+            means = torch.nn.functional.embedding_bag(flat, word_embeddings.weight, offsets, mode="mean")
+        return _normalize_rows(means.float().numpy())
+
+
+class SemanticCache:
+    """Capacity-bounded nearest-neighbour cache from text embeddings to probabilities
+
+    The oldest entry is overwritten once capacity is reached. Safe to share
+    between threads. audit_rate is the share of hits that the predictor
+    also scores in full; a hit counts as an error when its intents at
+    audit_threshold (a float or a per-intent sequence) differ from the
+    full model's.
+    """
+
+    def __init__(self, capacity=4096, min_similarity=0.9, embedder=None, audit_rate=0.0,
+                 audit_threshold=0.5, seed=None):
+        self.capacity = capacity
+        self.min_similarity = min_similarity
+        self.embedder = embedder or HashedEmbedder()
+        self.audit_rate = audit_rate
+        self.audit_threshold = audit_threshold
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._vectors = None
+        self._probabilities = None
+        self._next = 0
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.audited = 0
+        self.errors = 0
+        self.abs_error_sum = 0.0
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._size
+
+    def embed(self, texts):
+        return self.embedder(list(texts))
+
+    def lookup(self, vectors):
+        """(probabilities or None) per row of vectors, from the nearest cached entry"""
+        results = [None] * len(vectors)
+        with self._lock:
+            if self._size:
+                similarity = vectors @ self._vectors[:self._size].T
+                nearest = similarity.argmax(axis=1)
+                best = similarity[np.arange(len(vectors)), nearest]
+                for row in np.flatnonzero(best >= self.min_similarity):
+                    results[row] = torch.from_numpy(self._probabilities[nearest[row]].copy())
+            hits = sum(result is not None for result in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def add(self, vectors, probabilities):
+        """Insert rows, overwriting the oldest entries when full"""
+        if self.capacity <= 0 or not len(vectors):
+            return
+        if isinstance(probabilities, torch.Tensor):
+            probabilities = probabilities.detach().cpu().numpy()
+        vectors = vectors[-self.capacity:]
+        probabilities = probabilities[-self.capacity:]
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.capacity, vectors.shape[1]), dtype=np.float32)
+                self._probabilities = np.zeros((self.capacity, probabilities.shape[1]), dtype=np.float32)
+            slots = (self._next + np.arange(len(vectors))) % self.capacity
+            self._vectors[slots] = vectors
+            self._probabilities[slots] = probabilities
+            self._next = int(slots[-1] + 1) % self.capacity
+            self._size = min(self._size + len(vectors), self.capacity)
+
+    def sample_audit(self, rows):
+        """The subset of hit rows to verify against the full model"""
+        if self.audit_rate <= 0:
+            return []
+        with self._lock:
+            return [row for row in rows if self._random.random() < self.audit_rate]
+
+    def record_audit(self, cached, full):
+        """Compare cached probabilities of audited hits with full-model ones ([N, num_intents])"""
+        if not len(cached):
+            return
+        cached = torch.as_tensor(cached)
+        full = torch.as_tensor(full)
+        thresholds = torch.as_tensor(self.audit_threshold, dtype=cached.dtype)
+        mismatched = ((cached > thresholds) != (full > thresholds)).any(dim=1)
+        with self._lock:
+            self.audited += len(cached)
+            self.errors += int(mismatched.sum())
+            self.abs_error_sum += float((cached - full).abs().mean(dim=1).sum())
+
+    def clear(self):
+        """Drop all entries and reset the counters"""
+        with self._lock:
+            self._vectors = self._probabilities = None
+            self._next = self._size = 0
+            self.hits = self.misses = self.audited = self.errors = 0
+            self.abs_error_sum = 0.0
+
+    def stats(self):
+        """Hit rate, plus intent-set error rate and mean absolute error of audited hits"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'audited': self.audited,
+                'errors': self.errors,
+                'error_rate': self.errors / self.audited if self.audited else None,
+                'mean_abs_error': self.abs_error_sum / self.audited if self.audited else None,
+                'size': self._size,
+                'capacity': self.capacity,
+                'min_similarity': self.min_similarity
+            }
+
+
+def evaluate_similarity_bounds(predictor, texts, bounds=DEFAULT_BOUNDS, capacity=4096,
+                               embedder=None, threshold=0.5, batch_size=32):
+    """Replay texts through a fresh cache per bound, auditing every hit
+
+    The full model scores each text once; the replay then serves texts in
+    order, caching the misses, exactly as the predictor would. Exact
+    repeats are counted like any other hit.
+    """
+    texts = list(texts)
+    full = predictor._score_encoded(predictor._encode(texts), batch_size=batch_size)
+    embedder = embedder or HashedEmbedder()
+    vectors = embedder(texts)
+
+    report = []
+    for bound in bounds:
+        cache = SemanticCache(capacity, bound, embedder, audit_threshold=threshold)
+        for row in range(len(texts)):
+            cached = cache.lookup(vectors[row:row + 1])[0]
+            if cached is None:
+                cache.add(vectors[row:row + 1], full[row:row + 1])
+            else:
+                cache.record_audit(cached[None], full[row:row + 1])
+        report.append(cache.stats())
+    return report
+
+
+def print_bounds_report(report):
+    print(f"\n📊 Semantic cache replay ({report[0]['hits'] + report[0]['misses']} texts)")
+    for stats in report:
+        error_rate = stats['error_rate'] if stats['error_rate'] is not None else 0.0
+        mean_abs_error = stats['mean_abs_error'] if stats['mean_abs_error'] is not None else 0.0
+        print(f"   similarity ≥ {stats['min_similarity']:.2f}: hit rate {stats['hit_rate']:.1%}, "
+              f"intent-set errors {error_rate:.2%} of hits, mean |Δp| {mean_abs_error:.4f}")
+
+
+if __name__ == "__main__":
+    from inference_example import MultiIntentPredictor
+
+    parser = argparse.ArgumentParser(description="Measure semantic cache hit and error rates on a text file")
+    parser.add_argument("input", help="Text file, one utterance per line, in traffic order")
+    parser.add_argument("--weights", help="Memory-mapped weights from mmap_weights.py")
+    parser.add_argument("--bounds", help="Comma list of similarity bounds")
+    parser.add_argument("--capacity", type=int, default=4096)
+    parser.add_argument("--embedder", choices=["hashed", "token"], default="hashed")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    with open(args.input, encoding="utf-8") as f:
+        texts = [line.strip() for line in f if line.strip()]
+
+    predictor = MultiIntentPredictor(weights_path=args.weights, cache_size=0)
+    report = evaluate_similarity_bounds(
+        predictor,
+        texts,
+        bounds=[float(v) for v in args.bounds.split(",")] if args.bounds else DEFAULT_BOUNDS,
+        capacity=args.capacity,
+        embedder=TokenEmbedder(predictor) if args.embedder == "token" else HashedEmbedder(),
+        threshold=args.threshold,
+        batch_size=args.batch_size
+    )
+    print_bounds_report(report)
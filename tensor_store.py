@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Content-addressed per-tensor store for delta model updates
+
+Every tensor of a model is stored once under the SHA-256 of its bytes, and
+a model version is only a manifest naming the hash of each tensor:
+
+    objects/ab/ab12...   raw tensor bytes
+    versions/v7.json     {name: dtype, shape, sha256} plus model metadata
+    versions/LATEST      name of the newest version
+
+A node rebuilds a version as a flat weight file (mmap_weights.py) whose
+header records the hash of every tensor. The next update reads those
+hashes, copies the unchanged tensors from the local file and downloads
+only the objects it does not have, so rolling out a retrained classifier
+head moves kilobytes instead of the whole checkpoint.
+
+    python tensor_store.py publish multi_intent_model_reconstructed.pth --store model_store --version v7
+    python tensor_store.py update --base-url https://host/model_store --output multi_intent_model.flat
+    predictor = MultiIntentPredictor(weights_path="multi_intent_model.flat")
+"""
+import os
+import json
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from mmap_weights import (
+    FLAT_MODEL_PATH, _dtype_name, _tensor_bytes,
+    flat_layout, write_flat_header, read_flat_header, read_checkpoint
+)
+from reconstruct_from_github import (
+    DEFAULT_WORKERS, create_session, iter_location, join_location, fetch_to_offset
+)
+from metrics import METRICS
+
+LATEST_NAME = "versions/LATEST"
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def object_name(digest):
+    return f"objects/{digest[:2]}/{digest}"
+
+
+def version_name(version):
+    if not version or "/" in version or version.startswith("."):
+        raise ValueError(f"Invalid version name {version!r}")
+    return f"versions/{version}.json"
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    part_path = path + ".part"
+    with open(part_path, "wb") as f:
+        f.write(data)
+    os.replace(part_path, path)
+
+
+def publish_model(checkpoint_path, store_dir, version, config="bert-base-uncased", set_latest=True):
+    """Add a checkpoint (.pth or .flat) to the store as version
+
+    Only tensors whose bytes are not in the store yet are written.
+    """
+    state_dict, metadata = read_checkpoint(checkpoint_path, config)
+    manifest_path = os.path.join(store_dir, version_name(version))
+    if os.path.exists(manifest_path):
+        raise FileExistsError(f"Version {version} already exists in {store_dir}")
+
+    tensors = {}
+    new_objects = new_bytes = total_bytes = 0
+    for name, tensor in state_dict.items():
+        data = _tensor_bytes(tensor)
+        digest = hashlib.sha256(data).hexdigest()
+        path = os.path.join(store_dir, object_name(digest))
+        if not os.path.exists(path):
+            _write_atomic(path, data)
+            new_objects += 1
+            new_bytes += len(data)
+        total_bytes += len(data)
+        tensors[name] = {
+            "dtype": _dtype_name(tensor.dtype),
+            "shape": list(tensor.shape),
+            "sha256": digest
+        }
+
+    manifest = {"format": 1, "version": version, "metadata": metadata, "tensors": tensors}
+    _write_atomic(manifest_path, json.dumps(manifest, indent=2).encode("utf-8"))
+    if set_latest:
+        _write_atomic(os.path.join(store_dir, LATEST_NAME), version.encode("utf-8"))
+
+    print(f"✅ Published {version}: {len(tensors)} tensors, {new_objects} new objects "
+          f"({new_bytes / (1024 * 1024):.2f} of {total_bytes / (1024 * 1024):.2f} MB)")
+    return manifest
+
+
+def load_version(base_url, version=None, session=None):
+    """Manifest of version (default: LATEST) from a store URL or directory"""
+    if version is None:
+        version = b"".join(iter_location(join_location(base_url, LATEST_NAME), session)).decode().strip()
+    return json.loads(b"".join(iter_location(join_location(base_url, version_name(version)), session)))
+
+
+def diff_versions(old, new):
+    """Tensor names whose bytes differ between two manifests, and the bytes to fetch"""
+    old_hashes = {entry["sha256"] for entry in old["tensors"].values()}
+    entries, _ = flat_layout({
+        name: (entry["dtype"], tuple(entry["shape"])) for name, entry in new["tensors"].items()
+    })
+    changed = [
+        name for name, entry in new["tensors"].items()
+        if entry["sha256"] not in old_hashes
+    ]
+    return {
+        'changed': changed,
+        'fetch_bytes': sum(entries[name]["nbytes"] for name in changed),
+        'total_bytes': sum(entry["nbytes"] for entry in entries.values())
+    }
+
+
+def _local_tensors(path):
+    """({name: sha256}, {sha256: (entry, data start)}) of a flat file built from the store
+
+    Both are empty for a missing file or one not built from a store.
+    """
+    try:
+        header, data_start = read_flat_header(path)
+    except (OSError, ValueError):
+        return {}, {}
+    hashes = header["metadata"].get("tensor_store", {}).get("sha256", {})
+    return hashes, {
+        digest: (header["tensors"][name], data_start)
+        for name, digest in hashes.items() if name in header["tensors"]
+    }
+
+
+def _copy_range(source_path, source_offset, output_path, output_offset, size):
+    with open(source_path, "rb") as source, open(output_path, "r+b") as output:
+        source.seek(source_offset)
+        output.seek(output_offset)
+        while size > 0:
+            block = source.read(min(COPY_BLOCK_SIZE, size))
+            if not block:
+                raise RuntimeError(f"{source_path} ended early")
+            output.write(block)
+            size -= len(block)
+
+
+def update_model(base_url, version=None, output_path=FLAT_MODEL_PATH, workers=DEFAULT_WORKERS):
+    """Rebuild output_path as version, fetching only tensors it does not already hold
+
+    Returns a summary dict, or None on failure; the existing file stays in
+    place until the new one is complete.
+    """
+    with METRICS.time("reconstruct"):
+        return _update_model(base_url, version, output_path, workers)
+
+
+def _update_model(base_url, version, output_path, workers):
+    session = create_session(workers)
+    part_path = output_path + ".part"
+    try:
+        manifest = load_version(base_url, version, session)
+        hashes = {name: entry["sha256"] for name, entry in manifest["tensors"].items()}
+        local_hashes, local = _local_tensors(output_path)
+        if local_hashes == hashes:
+            print(f"✅ {output_path} is already at {manifest['version']}")
+            return {'version': manifest["version"], 'fetched': 0, 'reused': len(hashes), 'fetched_bytes': 0}
+
+        entries, size = flat_layout({
+            name: (entry["dtype"], tuple(entry["shape"])) for name, entry in manifest["tensors"].items()
+        })
+        metadata = dict(manifest["metadata"], tensor_store={"version": manifest["version"], "sha256": hashes})
+        with open(part_path, "wb") as f:
+            data_start = write_flat_header(f, entries, metadata)
+            f.truncate(data_start + size)
+
+        reused = [name for name in entries if hashes[name] in local]
+        # Identical tensors (e.g. fresh LayerNorm weights) are fetched once
+        pending = {}
+        for name in entries:
+            if hashes[name] not in local:
+                pending.setdefault(hashes[name], []).append(name)
+        for name in reused:
+            source, source_start = local[hashes[name]]
+            _copy_range(output_path, source_start + source["offset"],
+                        part_path, data_start + entries[name]["offset"], entries[name]["nbytes"])
+
+        lock = threading.Lock()
+        done = [0]
+
+        def fetch(digest):
+            name, *copies = pending[digest]
+            entry = entries[name]
+            fetched = fetch_to_offset(
+                join_location(base_url, object_name(digest)), part_path,
+                data_start + entry["offset"], entry["nbytes"], session
+            )
+            if fetched != digest:
+                raise RuntimeError(f"Checksum mismatch for {name}")
+            for copy in copies:
+                _copy_range(part_path, data_start + entry["offset"],
+                            part_path, data_start + entries[copy]["offset"], entry["nbytes"])
+            METRICS.inc("multi_intent_tensors_fetched_total",
+                        help_text="Tensors downloaded by delta model updates")
+            METRICS.inc("multi_intent_tensor_bytes_fetched_total", entry["nbytes"],
+                        help_text="Bytes downloaded by delta model updates")
+            with lock:
+                done[0] += 1
+                print(f"✅ {name} fetched ({entry['nbytes'] / 1024:.1f} KB) [{done[0]}/{len(pending)}]")
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(fetch, digest) for digest in pending]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+    except Exception as e:
+        print(f"❌ Failed to update model: {e}")
+        return None
+    finally:
+        session.close()
+
+    os.replace(part_path, output_path)
+    METRICS.inc("multi_intent_tensors_reused_total", len(reused),
+                help_text="Tensors copied from the local model by delta model updates")
+    fetched_bytes = sum(entries[names[0]]["nbytes"] for names in pending.values())
+    reused_bytes = sum(entries[name]["nbytes"] for name in reused)
+    print(f"🎉 {output_path} updated to {manifest['version']}: fetched {len(pending)} objects "
+          f"({fetched_bytes / 1024:.1f} KB), reused {len(reused)} tensors "
+          f"({reused_bytes / (1024 * 1024):.2f} MB)")
+    return {
+        'version': manifest["version"],
+        'fetched': len(pending),
+        'reused': len(reused),
+        'fetched_bytes': fetched_bytes
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Content-addressed tensor store for delta model updates")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    publish_parser = subparsers.add_parser("publish", help="Add a checkpoint (.pth or .flat) as a new version")
+    publish_parser.add_argument("checkpoint")
+    publish_parser.add_argument("--store", required=True, help="Store directory")
+    publish_parser.add_argument("--version", required=True)
+    publish_parser.add_argument("--config", default="bert-base-uncased",
+                                help="Encoder config name or local directory with config.json")
+    publish_parser.add_argument("--no-latest", action="store_true", help="Do not point LATEST at it")
+
+    update_parser = subparsers.add_parser("update", help="Bring a local flat file to a version")
+    update_parser.add_argument("--base-url", required=True, help="Store URL or directory")
+    update_parser.add_argument("--version", help="Default: LATEST")
+    update_parser.add_argument("--output", default=FLAT_MODEL_PATH)
+    update_parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+
+    diff_parser = subparsers.add_parser("diff", help="Tensors that change between two versions")
+    diff_parser.add_argument("--base-url", required=True, help="Store URL or directory")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new", nargs="?", help="Default: LATEST")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        publish_model(args.checkpoint, args.store, args.version, config=args.config,
+                      set_latest=not args.no_latest)
+    elif args.command == "update":
+        update_model(args.base_url, args.version, output_path=args.output, workers=args.workers)
+    else:
+        session = create_session(1)
+        report = diff_versions(load_version(args.base_url, args.old, session),
+                               load_version(args.base_url, args.new, session))
+        for name in report['changed']:
+            print(f"   {name}")
+        print(f"📊 {len(report['changed'])} tensors changed: {report['fetch_bytes'] / 1024:.1f} KB "
+              f"of {report['total_bytes'] / (1024 * 1024):.2f} MB to fetch")
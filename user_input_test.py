@@ -37,8 +37,9 @@ def test_with_user_inputs():
             print("-" * 40)
             
             # Get predictions
-            results = predictor.predict(sentence, threshold=0.3)
-            probabilities = predictor.predict_proba(sentence)
+            prediction = predictor.analyze(sentence, threshold=0.3)
+            results = prediction.intents
+            probabilities = prediction.probabilities
             
             if results:
                 print("🎯 PREDICTED INTENTS:")